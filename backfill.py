@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+過去記事のバックフィル用スクリプト
+ニュース一覧のページ送りをたどって過去の記事を1ページずつ処理し、
+未投稿の都内の新店情報をDiscordに投稿する
+
+初回デプロイ時や、DAYS_TO_CHECK日より長く停止していた後に実行する。
+中断しても次回は前回処理したページの続きから再開する。
+"""
+
+import sys
+import asyncio
+import logging
+import argparse
+from datetime import datetime
+from pathlib import Path
+
+# tenkaippin_bot.pyから必要なクラスをインポート
+sys.path.insert(0, str(Path(__file__).parent))
+from tenkaippin_bot import (
+    AsyncTenkaippinCrawler,
+    AsyncHistoryManager,
+    HISTORY_FILE,
+    HISTORY_RETENTION_DAYS,
+    CRAWLER_CONCURRENCY,
+    NEWS_URL,
+    send_store_posts,
+    DISCORD_TOKEN,
+    DISCORD_CHANNEL_ID
+)
+import discord
+from dotenv import load_dotenv
+
+# 環境変数の読み込み
+load_dotenv()
+
+# ロギング設定
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+# 中断時の再開位置を保存するクローラー状態のキー
+CHECKPOINT_KEY = 'backfill'
+
+
+def parse_args():
+    """コマンドライン引数を解析"""
+    parser = argparse.ArgumentParser(description='ニュース一覧の過去ページをさかのぼって都内の新店情報を投稿します')
+    parser.add_argument('--since', type=lambda s: datetime.strptime(s, '%Y-%m-%d'), default=None,
+                        help='この日付(YYYY-MM-DD)より古い記事に達したら終了（既定: 最後のページまで）')
+    parser.add_argument('--max-pages', type=int, default=0,
+                        help='今回処理する最大ページ数（0は無制限）')
+    parser.add_argument('--concurrency', type=int, default=CRAWLER_CONCURRENCY,
+                        help=f'詳細ページの同時取得数（既定: {CRAWLER_CONCURRENCY}）')
+    parser.add_argument('--interval', type=float, default=1.0,
+                        help='一覧ページを取得する間隔（秒、既定: 1.0）')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Discordに投稿せず、投稿対象の表示のみ行う（再開位置も保存しない）')
+    parser.add_argument('--restart', action='store_true',
+                        help='保存された再開位置を無視して最初のページから処理する')
+    return parser.parse_args()
+
+
+async def backfill(crawler, history_manager, args, channel=None):
+    """一覧ページを1ページずつ取得し、日付・都内の新店・投稿履歴の順に絞り込んで投稿
+
+    処理中に保持するのは1ページ分の記事のみで、ページごとに詳細ページのキャッシュも破棄する。
+    """
+    checkpoint = None if args.restart else crawler.state.get(CHECKPOINT_KEY)
+    start_url = checkpoint['next_url'] if checkpoint else NEWS_URL
+    if checkpoint:
+        logger.info(f"前回の続きから再開します: {start_url}")
+
+    pages = crawler.iter_archive_pages(start_url, interval=args.interval)
+    page_count = 0
+    total_items = 0
+    total_posted = 0
+    completed = False
+
+    while not args.max_pages or page_count < args.max_pages:
+        # 一覧ページの取得は同期処理のため、イベントループを止めないよう別スレッドで進める
+        page = await asyncio.to_thread(next, pages, None)
+        if page is None:
+            completed = True
+            break
+        page_count += 1
+        crawler.start_run()
+
+        items = page['items']
+        if args.since:
+            items = [item for item in items if item.published >= args.since]
+        total_items += len(items)
+
+        await crawler.prefetch_details(items)
+        candidates = [item for item in items if crawler.is_tokyo_store(item)]
+        posted_flags = await history_manager.is_posted_many(candidates)
+        tokyo_stores = [item for item, is_posted in zip(candidates, posted_flags) if not is_posted]
+
+        logger.info(
+            f"{page['url']}: {len(page['items'])}件中{len(items)}件が対象、"
+            f"未投稿の都内の新店情報{len(tokyo_stores)}件"
+        )
+
+        if args.dry_run:
+            for store_info in tokyo_stores:
+                print(f"[{store_info.date}] {store_info.title} {store_info.url}")
+        else:
+            # 古い記事から順に投稿（レート制限はdiscord.pyがルートごとのバケットに従って待機する）
+            posted_stores = await send_store_posts(
+                lambda embeds: channel.send(embeds=embeds), history_manager, tokyo_stores[::-1]
+            )
+            total_posted += len(posted_stores)
+
+        # 記事がすべて指定日より古いページに達したら終了
+        if args.since and page['items'] and not items:
+            completed = True
+            break
+        if not page['next_url']:
+            completed = True
+            break
+        if not args.dry_run:
+            # 再開位置より前の投稿が履歴に残るよう、履歴を書き戻してから再開位置を保存する
+            await history_manager.flush()
+            crawler.state.set(CHECKPOINT_KEY, {'next_url': page['next_url']})
+            await asyncio.to_thread(crawler.state.flush)
+
+    if completed and not args.dry_run:
+        crawler.state.set(CHECKPOINT_KEY, None)
+    logger.info(
+        f"バックフィル{'完了' if completed else '中断'}: {page_count}ページ、"
+        f"{total_items}件を処理、{total_posted}件を投稿"
+    )
+
+
+async def run_backfill(args):
+    """バックフィルのメイン処理"""
+    crawler = AsyncTenkaippinCrawler(concurrency=args.concurrency)
+    history_manager = AsyncHistoryManager(HISTORY_FILE, HISTORY_RETENTION_DAYS)
+
+    if args.dry_run:
+        try:
+            await history_manager.refresh()
+            await backfill(crawler, history_manager, args)
+        finally:
+            crawler.finish_run()
+            await history_manager.close()
+        return
+
+    if not DISCORD_TOKEN:
+        logger.error("DISCORD_TOKENが設定されていません。環境変数を確認してください。")
+        sys.exit(1)
+
+    if DISCORD_CHANNEL_ID == 0:
+        logger.error("DISCORD_CHANNEL_IDが設定されていません。環境変数を確認してください。")
+        sys.exit(1)
+
+    intents = discord.Intents.default()
+    client = discord.Client(intents=intents)
+
+    @client.event
+    async def on_ready():
+        """Botが起動したときの処理"""
+        logger.info(f'{client.user}としてログインしました')
+
+        try:
+            channel = client.get_channel(DISCORD_CHANNEL_ID)
+            if not channel:
+                logger.error(f"チャンネルID {DISCORD_CHANNEL_ID} が見つかりません")
+                return
+
+            await history_manager.refresh()
+            await backfill(crawler, history_manager, args, channel)
+        except Exception as e:
+            logger.error(f"バックフィル処理中にエラー: {e}", exc_info=True)
+        finally:
+            crawler.finish_run()
+            # 投稿履歴の変更をまとめて書き戻す
+            await history_manager.flush()
+            await history_manager.close()
+            if not client.is_closed():
+                await client.close()
+            await asyncio.sleep(0.25)  # 接続が完全に閉じるまで少し待機
+
+    try:
+        await client.start(DISCORD_TOKEN)
+    except KeyboardInterrupt:
+        logger.info("処理が中断されました")
+    except Exception as e:
+        logger.error(f"Bot起動エラー: {e}", exc_info=True)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(run_backfill(parse_args()))
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+オープン日抽出のベンチマークスクリプト
+従来の実装（キーワード×日付パターンごとにre.searchする方式）と、
+tenkaippin_bot.pyの1回走査の実装を、実際の記事本文で比較します
+
+記事本文はHTTPキャッシュ（HTTP_CACHE_DIR）に保存済みの記事ページから読み込みます。
+キャッシュが無い場合は --fetch を指定するとニュースページから記事を取得します。
+"""
+
+import re
+import sys
+import timeit
+import logging
+import argparse
+from pathlib import Path
+from typing import List, Optional
+
+sys.path.insert(0, str(Path(__file__).parent))
+from tenkaippin_bot import (
+    TenkaippinCrawler,
+    HttpCache,
+    HTTP_CACHE_DIR,
+    OPENING_DATE_EXTRACTOR
+)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# キャッシュが無く --fetch も指定されない場合に使う記事本文の例
+# （実際の記事ページと同程度の長さになるよう、ナビゲーション・定型文・フッターを前後に付ける）
+PAGE_HEADER = "ホーム メニュー 店舗検索 ニュース 会社情報 採用情報 お問い合わせ " * 6
+PAGE_BODY = "天下一品のこってりラーメンは、鶏ガラと野菜をじっくり煮込んだ濃厚スープが特徴です。" * 6
+PAGE_FOOTER = "Copyright © 天下一品 All Rights Reserved. プライバシーポリシー サイトマップ " * 8
+SAMPLE_TEXTS = [PAGE_HEADER + PAGE_BODY + text + PAGE_BODY + PAGE_FOOTER for text in [
+    "天下一品 新宿西口店 オープンのお知らせ 〒160-0023 東京都新宿区西新宿1-1-1 オープン日：2025年11月17日(月) 営業時間 11:00～23:00",
+    "いつも天下一品をご利用いただきありがとうございます。このたび渋谷に新店舗がオープンいたします。開店日 2025/1/10 皆様のご来店をお待ちしております。",
+    "期間限定メニューのお知らせ 2025.10.01より販売開始 ※一部店舗を除く",
+    "【新店情報】天下一品 池袋店 オープン日は2025年5月10日です。オープン記念として2025年5月10日～5月12日の3日間、ラーメン並を半額でご提供します。",
+    "店舗改装のお知らせ 改装期間：2025-04-01～2025-04-10 開店日は改めてお知らせいたします。",
+]]
+
+
+def legacy_extract_opening_date(text: str) -> Optional[str]:
+    """従来のオープン日抽出（比較用にそのまま残した実装）"""
+    if not text:
+        return None
+
+    opening_keywords = ['オープン日：', 'オープン日', '開店日：', '開店日', 'オープン', '開店']
+
+    date_patterns = [
+        r'(\d{4})年(\d{1,2})月(\d{1,2})日(?:\([月火水木金土日]\))?',
+        r'(\d{4})年(\d{1,2})月(\d{1,2})日',
+        r'(\d{4})/(\d{1,2})/(\d{1,2})',
+        r'(\d{4})\.(\d{1,2})\.(\d{1,2})',
+        r'(\d{4})-(\d{1,2})-(\d{1,2})',
+        r'(\d{4})年(\d{1,2})月(\d{1,2})',
+    ]
+
+    for keyword in opening_keywords:
+        keyword_index = text.find(keyword)
+        if keyword_index != -1:
+            start = keyword_index + len(keyword)
+            end = min(len(text), start + 300)
+            context = text[start:end]
+
+            for pattern in date_patterns:
+                match = re.search(pattern, context)
+                if match:
+                    year, month, day = match.groups()[:3]
+                    return f"{year}-{month.zfill(2)}-{day.zfill(2)}"
+
+    if 'オープン日' in text or '開店日' in text:
+        for pattern in date_patterns:
+            matches = list(re.finditer(pattern, text))
+            if matches:
+                match = matches[0]
+                year, month, day = match.groups()[:3]
+                return f"{year}-{month.zfill(2)}-{day.zfill(2)}"
+
+    return None
+
+
+def load_cached_texts(crawler: TenkaippinCrawler) -> List[str]:
+    """HTTPキャッシュに保存済みの記事ページから本文を取り出す"""
+    if not HTTP_CACHE_DIR:
+        return []
+    cache = HttpCache(Path(HTTP_CACHE_DIR))
+    texts = []
+    for url in list(cache.entries):
+        content = cache.read(url)
+        if content is None:
+            continue
+        text = crawler.parse_article_detail(crawler.decode_body(content, url))
+        if text:
+            texts.append(text)
+    return texts
+
+
+def fetch_texts(crawler: TenkaippinCrawler) -> List[str]:
+    """ニュースページから記事を取得して本文を取り出す"""
+    texts = []
+    for item in crawler.fetch_news():
+        if crawler.needs_detail(item):
+            text = crawler.fetch_article_detail(item.url)
+            if text:
+                texts.append(text)
+    return texts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='オープン日抽出の従来実装と新実装を比較します')
+    parser.add_argument('--fetch', action='store_true', help='キャッシュが無い場合にニュースページから記事を取得する')
+    parser.add_argument('--number', type=int, default=200, help='1回の計測で全記事を処理する回数')
+    parser.add_argument('--repeat', type=int, default=5, help='計測の繰り返し回数（最速の結果を表示）')
+    args = parser.parse_args()
+
+    crawler = TenkaippinCrawler(http_cache=None)
+    texts = load_cached_texts(crawler)
+    source = 'HTTPキャッシュ'
+    if not texts and args.fetch:
+        texts = fetch_texts(crawler)
+        source = 'ニュースページ'
+    if not texts:
+        texts = SAMPLE_TEXTS
+        source = '組み込みの例文'
+    logger.info(f"{source}の記事{len(texts)}件（平均{sum(map(len, texts)) // len(texts)}文字）で比較します")
+
+    # 出力の一致を確認（新実装は全角数字と令和の日付にも対応するため、その場合は差分として表示）
+    differences = 0
+    for text in texts:
+        legacy = legacy_extract_opening_date(text)
+        current = OPENING_DATE_EXTRACTOR.extract(text)
+        if legacy != current:
+            differences += 1
+            logger.info(f"結果が異なります: 従来={legacy} 新={current} 本文={text[:60]}...")
+    logger.info(f"結果の一致: {len(texts) - differences}/{len(texts)}件")
+
+    for name, func in [('従来', legacy_extract_opening_date), ('新', OPENING_DATE_EXTRACTOR.extract)]:
+        best = min(timeit.repeat(lambda: [func(text) for text in texts], number=args.number, repeat=args.repeat))
+        per_text = best / (args.number * len(texts)) * 1e6
+        print(f"{name}: {per_text:.1f}μs/記事")
+
+
+if __name__ == "__main__":
+    main()
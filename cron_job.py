@@ -3,25 +3,35 @@
 """
 Render Cron Jobs用のスクリプト
 毎日1回、ニュースをクロールしてDiscordに投稿する
+
+クロールと判定を先に行い、投稿する記事がない日はDiscordに接続せずに終了する
+投稿はGatewayに接続せず、Webhook（DISCORD_WEBHOOK_URL）またはBotトークンでREST APIに送信する
+（CRON_POST_MODE=gateway で従来どおりdiscord.Clientでログインして投稿）
 """
 
 import os
 import sys
+import time
 import asyncio
 import logging
-from datetime import datetime, timedelta
+from contextlib import contextmanager
 from pathlib import Path
+from typing import Dict, List, Optional
 
 # tenkaippin_bot.pyから必要なクラスをインポート
 sys.path.insert(0, str(Path(__file__).parent))
 from tenkaippin_bot import (
-    TenkaippinCrawler, 
-    HistoryManager, 
+    AsyncTenkaippinCrawler, 
+    AsyncHistoryManager, 
     HISTORY_FILE, 
     HISTORY_RETENTION_DAYS,
     DAYS_TO_CHECK,
+    NewsItem,
+    send_store_posts,
     DISCORD_TOKEN,
-    DISCORD_CHANNEL_ID
+    DISCORD_CHANNEL_ID,
+    DISCORD_WEBHOOK_URL,
+    DiscordRestPoster
 )
 import discord
 from dotenv import load_dotenv
@@ -40,136 +50,195 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-async def run_cron_job():
-    """Cron Jobs用のメイン処理"""
-    if not DISCORD_TOKEN:
-        logger.error("DISCORD_TOKENが設定されていません。環境変数を確認してください。")
-        sys.exit(1)
+# 投稿方法: rest（Gatewayに接続せずWebhook / REST APIで投稿）または gateway（discord.Clientでログインして投稿）
+CRON_POST_MODE = os.getenv("CRON_POST_MODE", "rest").lower()
+
+# Discordへのログイン（Gateway接続〜READY）にかかった時間を保存するクローラー状態のキー
+# ログインを省略した実行では、この値を短縮できた時間の目安としてログに出力する
+LOGIN_SECONDS_KEY = 'discord_login_seconds'
+# ログイン時間をまだ計測していない場合に使う目安（秒）
+LOGIN_BASELINE_SECONDS = float(os.getenv("LOGIN_BASELINE_SECONDS", "2.0"))
+# Gateway接続を閉じた後の待機時間（秒）
+GATEWAY_CLOSE_WAIT = 0.25
+
+
+@contextmanager
+def measure(timings: Dict[str, float], name: str):
+    """ブロックの実行時間（秒）をtimings[name]に記録"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = time.perf_counter() - started
+
+
+def log_timings(timings: Dict[str, float], total: float, saved: Optional[float] = None):
+    """工程ごとの所要時間と、Gatewayへのログインを省略して短縮できた時間の目安をログに出力"""
+    phases = ' / '.join(f"{name}{seconds:.2f}秒" for name, seconds in timings.items())
+    message = f"処理時間: {phases} / 合計{total:.2f}秒"
+    if saved:
+        message += f"（Gatewayへのログインを省略し、約{saved:.2f}秒短縮）"
+    logger.info(message)
+
+
+def login_saving(crawler, timings: Dict[str, float]) -> Optional[float]:
+    """今回Gatewayにログインしなかった場合、ログインと切断待ちで短縮できた時間の目安（秒）
     
-    if DISCORD_CHANNEL_ID == 0:
-        logger.error("DISCORD_CHANNEL_IDが設定されていません。環境変数を確認してください。")
-        sys.exit(1)
+    前回計測したログイン時間（クローラーの状態に保存）があればそれを、なければLOGIN_BASELINE_SECONDSを使う
+    """
+    if 'ログイン' in timings:
+        return None
+    baseline = crawler.state.get(LOGIN_SECONDS_KEY) or LOGIN_BASELINE_SECONDS
+    return baseline + GATEWAY_CLOSE_WAIT
+
+
+async def find_new_tokyo_stores(crawler, history_manager) -> List[NewsItem]:
+    """新しい記事から、未投稿の都内の新店情報を抽出"""
+    # 直近N日以内で、前回処理した記事より新しい記事のみを処理
+    recent_news = list(crawler.iter_new_news(DAYS_TO_CHECK))
+    
+    if not recent_news:
+        logger.info(f"直近{DAYS_TO_CHECK}日以内の新しい記事が見つかりませんでした")
+        return []
+    
+    # 判定に必要な詳細ページをまとめて並行取得
+    await crawler.prefetch_details(recent_news)
+    
+    # 都内の新店情報をフィルタリングし、投稿履歴をまとめてチェック
+    candidates = [item for item in recent_news if crawler.is_tokyo_store(item)]
+    posted_flags = await history_manager.is_posted_many(candidates)
+    tokyo_stores = []
+    for item, is_posted in zip(candidates, posted_flags):
+        if is_posted:
+            continue
+        # オープン日がまだ抽出されていない場合、詳細ページから抽出
+        if item.opening_date is None:
+            url = item.url
+            if url and url != "https://www.tenkaippin.co.jp/news/":
+                detail_text = crawler.fetch_article_detail(url)
+                if detail_text:
+                    opening_date = crawler.extract_opening_date(detail_text)
+                    if opening_date:
+                        item.opening_date = opening_date
+                        logger.info(f"オープン日を抽出: {opening_date}")
+        tokyo_stores.append(item)
+    
+    return tokyo_stores
+
+
+async def post_via_rest(tokyo_stores: List[NewsItem], crawler, history_manager, timings: Dict[str, float]):
+    """Gatewayに接続せず、Webhook / REST APIで都内の新店情報を投稿"""
+    with measure(timings, '投稿'):
+        async with DiscordRestPoster(DISCORD_TOKEN, DISCORD_CHANNEL_ID, DISCORD_WEBHOOK_URL) as poster:
+            await send_store_posts(poster.send, history_manager, tokyo_stores)
     
+    crawler.commit_progress()
+    logger.info("クロール・投稿処理が完了しました")
+
+
+async def post_to_discord(tokyo_stores: List[NewsItem], crawler, history_manager, timings: Dict[str, float]):
+    """Discordにログインして都内の新店情報を投稿"""
     # Discord Botクライアントを作成
     intents = discord.Intents.default()
     client = discord.Client(intents=intents)
-    
-    crawler = TenkaippinCrawler()
-    history_manager = HistoryManager(HISTORY_FILE, HISTORY_RETENTION_DAYS)
+    login_started = time.perf_counter()
     
     @client.event
     async def on_ready():
         """Botが起動したときの処理"""
+        timings['ログイン'] = time.perf_counter() - login_started
+        crawler.state.set(LOGIN_SECONDS_KEY, round(timings['ログイン'], 2))
         logger.info(f'{client.user}としてログインしました')
         
         try:
-            # ニュースをクロールして投稿
-            logger.info("ニュースのクロールを開始します...")
-            news_items = crawler.fetch_news()
-            
-            if not news_items:
-                logger.warning("ニュース記事が取得できませんでした")
-                await client.close()
-                return
-            
-            # 直近N日以内の記事のみを処理
-            cutoff_date = datetime.now() - timedelta(days=DAYS_TO_CHECK)
-            recent_news = []
-            
-            for item in news_items:
-                date_str = item.get('date', '')
-                try:
-                    item_date = datetime.strptime(date_str, '%Y-%m-%d')
-                    if item_date >= cutoff_date:
-                        recent_news.append(item)
-                except (ValueError, TypeError) as e:
-                    logger.warning(f"日付のパースエラー: {date_str} - {e}")
-                    continue
-            
-            logger.info(f"日付フィルタリング: {len(news_items)}件 → {len(recent_news)}件（直近{DAYS_TO_CHECK}日以内）")
-            
-            if not recent_news:
-                logger.info(f"直近{DAYS_TO_CHECK}日以内の記事が見つかりませんでした")
-                await client.close()
-                return
-            
-            # 都内の新店情報をフィルタリング（投稿履歴もチェック）
-            tokyo_stores = []
-            for item in recent_news:
-                if crawler.is_tokyo_store(item) and not history_manager.is_posted(item):
-                    # オープン日がまだ抽出されていない場合、詳細ページから抽出
-                    if 'opening_date' not in item:
-                        url = item.get('url')
-                        if url and url != "https://www.tenkaippin.co.jp/news/":
-                            detail_text = crawler.fetch_article_detail(url)
-                            if detail_text:
-                                opening_date = crawler.extract_opening_date(detail_text)
-                                if opening_date:
-                                    item['opening_date'] = opening_date
-                                    logger.info(f"オープン日を抽出: {opening_date}")
-                    tokyo_stores.append(item)
-            
-            if not tokyo_stores:
-                logger.info("都内の新店情報は見つかりませんでした")
-                await client.close()
-                return
-            
             # Discordチャンネルに投稿
             channel = client.get_channel(DISCORD_CHANNEL_ID)
             if not channel:
                 logger.error(f"チャンネルID {DISCORD_CHANNEL_ID} が見つかりません")
-                await client.close()
                 return
             
-            for store_info in tokyo_stores:
-                embed = discord.Embed(
-                    title="東京に天下一品がオープンするよ！",
-                    description=store_info['title'],
-                    url=store_info['url'],
-                    color=discord.Color.orange(),
-                    timestamp=datetime.now()
-                )
-                embed.add_field(name="記事日付", value=store_info['date'], inline=True)
-                
-                # オープン日がある場合は表示
-                opening_date = store_info.get('opening_date')
-                if opening_date:
-                    embed.add_field(name="オープン日", value=opening_date, inline=True)
-                
-                embed.add_field(name="詳細", value=f"[記事を読む]({store_info['url']})", inline=True)
-                
-                await channel.send(embed=embed)
-                history_manager.mark_as_posted(store_info)
-                logger.info(f"投稿しました: {store_info['title']}")
-                
-                # レート制限を避けるため少し待機
-                await asyncio.sleep(1)
+            with measure(timings, '投稿'):
+                # レート制限はdiscord.pyがルートごとのバケットに従って待機する
+                await send_store_posts(lambda embeds: channel.send(embeds=embeds), history_manager, tokyo_stores)
             
+            crawler.commit_progress()
             logger.info("クロール・投稿処理が完了しました")
             
         except Exception as e:
-            logger.error(f"クロール・投稿処理中にエラー: {e}", exc_info=True)
+            logger.error(f"投稿処理中にエラー: {e}", exc_info=True)
         finally:
-            # データベース接続を閉じる
-            if history_manager.db_conn:
-                try:
-                    history_manager.db_conn.close()
-                except:
-                    pass
             # Discordクライアントを適切に閉じる
             if not client.is_closed():
                 await client.close()
             # HTTPセッションをクリーンアップ
-            await asyncio.sleep(0.25)  # 接続が完全に閉じるまで少し待機
+            await asyncio.sleep(GATEWAY_CLOSE_WAIT)  # 接続が完全に閉じるまで少し待機
     
     # Botを起動
     try:
         await client.start(DISCORD_TOKEN)
+    finally:
+        # ログインに失敗した場合もHTTPセッションを閉じる
+        if not client.is_closed():
+            await client.close()
+
+
+async def run_cron_job():
+    """Cron Jobs用のメイン処理
+    
+    先にクロールと判定を行い、投稿する都内の新店情報がある場合のみDiscordにログインする
+    """
+    use_webhook = CRON_POST_MODE == 'rest' and DISCORD_WEBHOOK_URL
+    if not DISCORD_TOKEN and not use_webhook:
+        logger.error("DISCORD_TOKEN（またはDISCORD_WEBHOOK_URL）が設定されていません。環境変数を確認してください。")
+        sys.exit(1)
+    
+    if DISCORD_CHANNEL_ID == 0 and not use_webhook:
+        logger.error("DISCORD_CHANNEL_IDが設定されていません。環境変数を確認してください。")
+        sys.exit(1)
+    
+    started = time.perf_counter()
+    timings: Dict[str, float] = {}
+    crawler = AsyncTenkaippinCrawler()
+    
+    # ニュース一覧が前回から変わっていなければ、解析もDiscordへのログインもせずに終了
+    with measure(timings, '変更チェック'):
+        index_changed = crawler.check_index_changed()
+    if not index_changed:
+        logger.info("ニュース一覧に変更がないため処理をスキップします")
+        log_timings(timings, time.perf_counter() - started, login_saving(crawler, timings))
+        return
+    
+    history_manager = AsyncHistoryManager(HISTORY_FILE, HISTORY_RETENTION_DAYS)
+    try:
+        logger.info("ニュースのクロールを開始します...")
+        with measure(timings, 'クロール・判定'):
+            tokyo_stores = await find_new_tokyo_stores(crawler, history_manager)
+        
+        if not tokyo_stores:
+            logger.info("都内の新店情報は見つかりませんでした")
+            crawler.commit_progress()
+            logger.info("投稿がないためDiscordへの接続を省略しました")
+            return
+        
+        if CRON_POST_MODE == 'gateway':
+            await post_to_discord(tokyo_stores, crawler, history_manager, timings)
+        else:
+            await post_via_rest(tokyo_stores, crawler, history_manager, timings)
+    
     except KeyboardInterrupt:
         logger.info("処理が中断されました")
-    except Exception as e:
+    except discord.DiscordException as e:
         logger.error(f"Bot起動エラー: {e}", exc_info=True)
         sys.exit(1)
+    except Exception as e:
+        logger.error(f"クロール・投稿処理中にエラー: {e}", exc_info=True)
+    finally:
+        crawler.finish_run()
+        # 投稿履歴の変更をまとめて書き戻す
+        await history_manager.flush()
+        # データベース接続を閉じる
+        await history_manager.close()
+        log_timings(timings, time.perf_counter() - started, login_saving(crawler, timings))
 
 
 if __name__ == "__main__":
@@ -6,42 +6,28 @@
 """
 
 import sys
+import asyncio
 from pathlib import Path
 from datetime import datetime
 
 # tenkaippin_bot.pyから必要なクラスをインポート
 sys.path.insert(0, str(Path(__file__).parent))
 from tenkaippin_bot import (
-    TenkaippinCrawler, 
+    AsyncTenkaippinCrawler, 
     HistoryManager, 
     HISTORY_FILE, 
     HISTORY_RETENTION_DAYS,
-    DAYS_TO_CHECK
+    DAYS_TO_CHECK,
+    build_store_messages,
+    POST_FORMAT
 )
 from dotenv import load_dotenv
-import discord
 
 # 環境変数の読み込み
 load_dotenv()
 
-def preview_embed(store_info):
+def preview_embed(embed):
     """Embedの内容をプレビュー表示"""
-    embed = discord.Embed(
-        title="東京に天下一品がオープンするよ！",
-        description=store_info['title'],
-        url=store_info['url'],
-        color=discord.Color.orange(),
-        timestamp=datetime.now()
-    )
-    embed.add_field(name="記事日付", value=store_info['date'], inline=True)
-    
-    # オープン日がある場合は表示
-    opening_date = store_info.get('opening_date')
-    if opening_date:
-        embed.add_field(name="オープン日", value=opening_date, inline=True)
-    
-    embed.add_field(name="詳細", value=f"[記事を読む]({store_info['url']})", inline=True)
-    
     # Embedの内容をテキスト形式で表示
     print("=" * 60)
     print("📋 Discord投稿プレビュー")
@@ -64,7 +50,7 @@ def main():
     """メイン処理"""
     print("天下一品ニュース取得中...")
     
-    crawler = TenkaippinCrawler()
+    crawler = AsyncTenkaippinCrawler()
     history_manager = HistoryManager(HISTORY_FILE, HISTORY_RETENTION_DAYS)
     
     # ニュースを取得
@@ -80,34 +66,39 @@ def main():
     recent_news = []
     
     for item in news_items:
-        date_str = item.get('date', '')
         try:
-            item_date = datetime.strptime(date_str, '%Y-%m-%d')
-            if item_date >= cutoff_date:
+            if item.published >= cutoff_date:
                 recent_news.append(item)
         except (ValueError, TypeError):
             continue
     
     print(f"✅ {len(recent_news)}件の直近{DAYS_TO_CHECK}日以内の記事を取得\n")
     
+    # 判定に必要な詳細ページをまとめて並行取得
+    asyncio.run(crawler.prefetch_details(recent_news))
+    
     # 都内の新店情報をフィルタリング
-    tokyo_stores = []
+    candidates = []
     for item in recent_news:
         if crawler.is_tokyo_store(item):
             # オープン日がまだ抽出されていない場合、詳細ページから抽出
-            if 'opening_date' not in item:
-                url = item.get('url')
+            if item.opening_date is None:
+                url = item.url
                 if url and url != "https://www.tenkaippin.co.jp/news/":
                     detail_text = crawler.fetch_article_detail(url)
                     if detail_text:
                         opening_date = crawler.extract_opening_date(detail_text)
                         if opening_date:
-                            item['opening_date'] = opening_date
+                            item.opening_date = opening_date
                             print(f"✅ オープン日を抽出: {opening_date}")
-            
-            # 投稿履歴をチェック（プレビューなので実際には投稿しない）
-            if not history_manager.is_posted(item):
-                tokyo_stores.append(item)
+            candidates.append(item)
+    
+    # 投稿履歴をまとめてチェック（プレビューなので実際には投稿しない）
+    posted_flags = history_manager.is_posted_many(candidates)
+    tokyo_stores = [item for item, is_posted in zip(candidates, posted_flags) if not is_posted]
+    
+    # プレビューなので、学習したセレクタや文字コードなどの状態はGist / PostgreSQLに書き戻さない
+    crawler.finish_run(persist=False)
     
     if not tokyo_stores:
         print("都内の新店情報は見つかりませんでした")
@@ -115,12 +106,14 @@ def main():
     
     print(f"\n✅ {len(tokyo_stores)}件の都内新店情報が見つかりました\n")
     
-    # 各記事の投稿内容をプレビュー
-    for i, store_info in enumerate(tokyo_stores, 1):
-        print(f"\n【記事 {i}/{len(tokyo_stores)}】")
-        preview_embed(store_info)
+    # 投稿形式（POST_FORMAT）に従って、メッセージごとに投稿内容をプレビュー
+    messages = build_store_messages(tokyo_stores, POST_FORMAT)
+    for i, (stores, embeds) in enumerate(messages, 1):
+        print(f"\n【メッセージ {i}/{len(messages)}】（{POST_FORMAT}: 記事{len(stores)}件 / Embed{len(embeds)}件）")
+        for embed in embeds:
+            preview_embed(embed)
         
-        if i < len(tokyo_stores):
+        if i < len(messages):
             print("\n" + "-" * 60 + "\n")
 
 if __name__ == "__main__":
@@ -8,15 +8,28 @@
 import os
 import re
 import json
+import sqlite3
+import codecs
+import hashlib
 import asyncio
 import logging
+import threading
+import time
+import tracemalloc
+import unicodedata
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import List, Dict, Optional
-from urllib.parse import urljoin
+from typing import List, Dict, Optional, Set, Callable, Any, Iterator, Tuple, Awaitable
+from urllib.parse import urljoin, urlsplit
 
+import aiohttp
 import requests
-from bs4 import BeautifulSoup
+from requests.compat import chardet
+from bs4 import BeautifulSoup, SoupStrainer
 import discord
 from discord.ext import tasks
 from dotenv import load_dotenv
@@ -38,10 +51,21 @@ load_dotenv()
 # 設定
 NEWS_URL = "https://www.tenkaippin.co.jp/news/"
 HISTORY_FILE = Path("posted_history.json")
+# GistやPostgreSQLを使わない場合のローカルの履歴データベース（SQLite）
+HISTORY_DB_FILE = Path(os.getenv("HISTORY_DB_FILE", "posted_history.db"))
+# "file" を指定するとSQLiteの代わりにJSONLファイルで履歴を管理する
+HISTORY_BACKEND = os.getenv("HISTORY_BACKEND", "")
 # チェックする日付範囲（日数）。この日数以内の記事のみを処理
 DAYS_TO_CHECK = int(os.getenv("DAYS_TO_CHECK", "7"))  # デフォルト7日間
 # 投稿履歴の保持期間（日数）。この期間を超えた履歴は自動削除
 HISTORY_RETENTION_DAYS = int(os.getenv("HISTORY_RETENTION_DAYS", "90"))  # デフォルト90日間
+# PostgreSQLの接続プールの最大接続数
+DB_POOL_MAX_CONN = int(os.getenv("DB_POOL_MAX_CONN", "4"))
+# 接続エラー時の最大試行回数と、初回の再接続待ち時間（秒、試行ごとに倍増）
+DB_MAX_RETRIES = 3
+DB_RETRY_BACKOFF = 0.5
+# この秒数以上使われていなかった接続は、使う前にSELECT 1で生存確認する
+DB_VALIDATE_IDLE_SECONDS = 60
 TOKYO_KEYWORDS = [
     "東京", "都内", "新宿", "渋谷", "池袋", "上野", "品川", "目黒", "世田谷",
     "大田", "杉並", "練馬", "板橋", "北区", "荒川", "台東", "墨田", "江東",
@@ -51,78 +75,1126 @@ TOKYO_KEYWORDS = [
     "東久留米", "武蔵村山", "多摩", "稲城", "羽村", "あきる野", "西東京",
     "23区", "東京都"
 ]
+# 新店関連のキーワード
+STORE_KEYWORDS = ['オープン', '開店', '新店', '店舗', '店']
+# 開店を明示するキーワード（除外キーワードと同時にタイトルにあれば除外しない）
+OPENING_KEYWORDS = ['オープン', '開店', '新店']
+# 閉店・休業などのお知らせとして除外するキーワード（タイトルのみ対象）
+EXCLUDE_KEYWORDS = ['閉店', '休業', '営業終了', '閉鎖']
+# 東京都の62区市町村（23区、26市、5町、8村）
+TOKYO_MUNICIPALITIES = [
+    "千代田区", "中央区", "港区", "新宿区", "文京区", "台東区", "墨田区", "江東区",
+    "品川区", "目黒区", "大田区", "世田谷区", "渋谷区", "中野区", "杉並区", "豊島区",
+    "北区", "荒川区", "板橋区", "練馬区", "足立区", "葛飾区", "江戸川区",
+    "八王子市", "立川市", "武蔵野市", "三鷹市", "青梅市", "府中市", "昭島市", "調布市",
+    "町田市", "小金井市", "小平市", "日野市", "東村山市", "国分寺市", "国立市", "福生市",
+    "狛江市", "東大和市", "清瀬市", "東久留米市", "武蔵村山市", "多摩市", "稲城市", "羽村市",
+    "あきる野市", "西東京市",
+    "瑞穂町", "日の出町", "奥多摩町", "大島町", "八丈町",
+    "檜原村", "利島村", "新島村", "神津島村", "三宅村", "御蔵島村", "青ヶ島村", "小笠原村"
+]
+# 他の道府県にも同名があるため、「東京都」に続く場合のみ都内と判定する区市町名
+# （「大島町」は山口県の周防大島町にも含まれる）
+AMBIGUOUS_MUNICIPALITIES = {"中央区", "港区", "北区", "府中市", "大島町"}
+# 郵便番号の先頭桁から区市町村への対応（登録された先頭桁に一致した郵便番号のみ都内と判定する）
+# 複数の区市町村にまたがる先頭3桁は、判明している先頭4〜5桁（例: 100-00xx → "10000"）のみ登録する
+# 100〜208の範囲でも都内ではない先頭3桁（199: 神奈川県相模原市緑区など）は登録しない
+TOKYO_POSTAL_PREFIXES = {
+    "10000": "千代田区", "1006": "千代田区", "101": "千代田区", "102": "千代田区",
+    "103": "中央区", "104": "中央区",
+    "105": "港区", "106": "港区", "107": "港区", "108": "港区",
+    "110": "台東区", "111": "台東区", "112": "文京区", "113": "文京区",
+    "114": "北区", "115": "北区", "116": "荒川区",
+    "120": "足立区", "121": "足立区", "123": "足立区", "124": "葛飾区", "125": "葛飾区",
+    "130": "墨田区", "131": "墨田区", "132": "江戸川区", "133": "江戸川区", "134": "江戸川区",
+    "135": "江東区", "136": "江東区",
+    "140": "品川区", "141": "品川区", "142": "品川区",
+    "143": "大田区", "144": "大田区", "145": "大田区", "146": "大田区",
+    "150": "渋谷区", "151": "渋谷区", "152": "目黒区", "153": "目黒区",
+    "154": "世田谷区", "155": "世田谷区", "156": "世田谷区", "157": "世田谷区", "158": "世田谷区",
+    "160": "新宿区", "161": "新宿区", "162": "新宿区", "163": "新宿区", "169": "新宿区",
+    "164": "中野区", "165": "中野区", "166": "杉並区", "167": "杉並区", "168": "杉並区",
+    "170": "豊島区", "171": "豊島区",
+    "173": "板橋区", "174": "板橋区", "175": "板橋区",
+    "176": "練馬区", "177": "練馬区", "178": "練馬区", "179": "練馬区",
+    "180": "武蔵野市", "181": "三鷹市", "182": "調布市", "183": "府中市", "184": "小金井市",
+    "185": "国分寺市", "186": "国立市", "187": "小平市", "188": "西東京市", "189": "東村山市",
+    "19000": "立川市", "191": "日野市", "192": "八王子市", "193": "八王子市",
+    "194": "町田市", "195": "町田市", "196": "昭島市",
+    "19700": "福生市", "19708": "あきる野市", "19800": "青梅市", "19802": "奥多摩町",
+    "201": "狛江市", "202": "西東京市", "203": "東久留米市", "204": "清瀬市", "205": "羽村市",
+    "20600": "多摩市", "20608": "稲城市", "207": "東大和市", "208": "武蔵村山市",
+    # 伊豆諸島・小笠原諸島
+    "10001": "大島町", "10003": "利島村", "10004": "新島村", "10005": "新島村", "10006": "神津島村",
+    "10011": "三宅村", "10012": "三宅村", "10013": "御蔵島村",
+    "10014": "八丈町", "10015": "八丈町", "10016": "八丈町", "10017": "青ヶ島村",
+    "10021": "小笠原村", "10022": "小笠原村"
+}
+# すべて都内だが、区市町村が先頭3桁だけでは決まらない郵便番号（区市町村は不明として都内と判定する）
+TOKYO_SHARED_POSTAL_AREAS = {"100", "190", "197", "198", "206"}
+# 東京都以外の46道府県（正式名称）
+OTHER_PREFECTURES = [
+    "北海道", "青森県", "岩手県", "宮城県", "秋田県", "山形県", "福島県",
+    "茨城県", "栃木県", "群馬県", "埼玉県", "千葉県", "神奈川県",
+    "新潟県", "富山県", "石川県", "福井県", "山梨県", "長野県", "岐阜県", "静岡県", "愛知県",
+    "三重県", "滋賀県", "京都府", "大阪府", "兵庫県", "奈良県", "和歌山県",
+    "鳥取県", "島根県", "岡山県", "広島県", "山口県",
+    "徳島県", "香川県", "愛媛県", "高知県",
+    "福岡県", "佐賀県", "長崎県", "熊本県", "大分県", "宮崎県", "鹿児島県", "沖縄県"
+]
+# 東京都以外の46道府県と主要都市（都内キーワードが無く、これらがあれば詳細ページを取得せず都外と判定）
+# 「石川」（小石川）や「大宮」「船橋」「松山」のように都内にもある地名は登録しない（県名は正式名称のみ）
+# 同様に「長崎」（東長崎・南長崎）「佐賀」（江東区佐賀）「島根」（足立区島根）「浜松」（浜松町）
+# 「仙台」（仙台坂）「川越」（川越街道）も登録しない
+# 「京都」は「京都発祥」のように都内の店舗の記事にも現れるため、「京都府」「京都市」のみ登録する
+NON_TOKYO_PLACES = OTHER_PREFECTURES + [
+    # 地名として紛れにくい道府県名
+    "青森", "岩手", "秋田", "山形", "茨城", "栃木", "群馬", "埼玉", "神奈川", "新潟",
+    "富山", "福井", "山梨", "長野", "岐阜", "静岡", "愛知", "滋賀", "大阪",
+    "兵庫", "和歌山", "鳥取", "岡山", "広島", "徳島", "香川", "愛媛", "高知",
+    "福岡", "熊本", "大分", "宮崎", "鹿児島", "沖縄",
+    # 主要都市
+    "札幌", "旭川", "函館", "京都市", "仙台市", "郡山", "いわき", "宇都宮", "前橋", "高崎",
+    "さいたま", "浦和", "川越市", "越谷", "所沢", "千葉市", "柏市", "松戸",
+    "横浜", "川崎", "相模原", "横須賀", "藤沢", "厚木", "金沢", "浜松市", "名古屋", "豊橋", "岡崎",
+    "四日市", "大津", "堺", "枚方", "東大阪", "神戸", "姫路", "尼崎", "西宮", "倉敷",
+    "福山", "北九州", "久留米", "那覇"
+]
+# 詳細ページを並行取得する際の同一ホストへの最大同時接続数
+CRAWLER_CONCURRENCY = int(os.getenv("CRAWLER_CONCURRENCY", "4"))
+# HTTPリクエストのタイムアウト（秒）
+REQUEST_TIMEOUT = 10
+# 記事ページのHTTPキャッシュ（空文字列で無効化）
+HTTP_CACHE_DIR = os.getenv("HTTP_CACHE_DIR", ".http_cache")
+# HTTPキャッシュの保持期間（日数）と最大サイズ（MB）
+HTTP_CACHE_MAX_AGE_DAYS = int(os.getenv("HTTP_CACHE_MAX_AGE_DAYS", "30"))
+HTTP_CACHE_MAX_MB = int(os.getenv("HTTP_CACHE_MAX_MB", "50"))
+# クローラーの状態（ニュース一覧のフィンガープリントなど）を保存するファイル
+CRAWLER_STATE_FILE = Path(os.getenv("CRAWLER_STATE_FILE", ".crawler_state.json"))
+# 履歴をGistで管理する場合に、クローラーの状態を保存するGist内のファイル名
+CRAWLER_STATE_GIST_FILE = "crawler_state.json"
+# ニュース一覧が前回の実行から変わっていなければ処理をスキップする
+SKIP_UNCHANGED_INDEX = os.getenv("SKIP_UNCHANGED_INDEX", "true").lower() == "true"
+# 前回処理した最新の記事（ハイウォーターマーク）に到達したらニュース一覧の処理を打ち切る
+INCREMENTAL_CRAWL = os.getenv("INCREMENTAL_CRAWL", "true").lower() == "true"
+# 古い記事がこの件数続いたら打ち切る（並び順が多少前後しても取りこぼさないための余裕）
+INCREMENTAL_STOP_TOLERANCE = 3
+# ニュース一覧の「次のページ」リンクとみなすリンクテキスト
+NEXT_PAGE_TEXTS = ['次へ', '次のページ', '次', '›', '»', '>', 'Next', 'next']
+# 宣言された文字コード名を、実際のページで使われる上位互換の文字コードに読み替える
+ENCODING_ALIASES = {'shift_jis': 'cp932', 'euc_jp': 'euc_jis_2004'}
+# <meta charset> を探すページ先頭のバイト数
+META_CHARSET_SCAN_BYTES = 4096
+META_CHARSET_PATTERN = re.compile(rb'<meta[^>]+charset=["\']?\s*([A-Za-z0-9_\-]+)', re.I)
+# HTMLパーサー（auto / selectolax / lxml / html.parser）
+# autoはインストール済みのものからselectolax（記事本文の抽出のみ）→ lxml → html.parserの順に選ぶ
+HTML_PARSER = os.getenv("HTML_PARSER", "auto").lower()
+# ページごとの解析時間とピークメモリをログに出力する
+PARSE_PROFILE = os.getenv("PARSE_PROFILE", "false").lower() == "true"
+# ニュース一覧の記事要素（この要素だけを解析する）
+NEWS_CLASS_PATTERN = re.compile(r'news|item|entry', re.I)
+NEWS_ELEMENT_STRAINER = SoupStrainer(['li', 'div', 'article'], class_=NEWS_CLASS_PATTERN)
+# ページ送りのリンクを探すためのリンク要素
+LINK_STRAINER = SoupStrainer(['a', 'link'])
+# 記事本文の候補（一般的な記事本文のセレクタ、優先順）
+ARTICLE_CONTENT_SELECTORS = [
+    'article', '.article', '.content', '.post-content',
+    '.entry-content', 'main', '.main-content'
+]
+
+# イベントループがこの秒数以上止まったら警告をログに出力する
+LOOP_LAG_THRESHOLD = float(os.getenv("LOOP_LAG_THRESHOLD", "1.0"))
+# イベントループの遅延を計測する間隔（秒）
+LOOP_LAG_CHECK_INTERVAL = 0.5
 
 # Discord設定
 DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
 DISCORD_CHANNEL_ID = int(os.getenv("DISCORD_CHANNEL_ID", "0"))
+# チャンネルのWebhook URL（設定するとcron_job.pyはBotトークンの代わりにWebhookで投稿する）
+DISCORD_WEBHOOK_URL = os.getenv("DISCORD_WEBHOOK_URL", "")
+# Gatewayを使わずに投稿する際のDiscord REST APIのベースURL
+DISCORD_API_BASE = "https://discord.com/api/v10"
+# レート制限（HTTP 429）を受けたときの最大試行回数
+DISCORD_MAX_RETRIES = 5
+# 投稿形式: single（1記事1メッセージ）/ batch（1メッセージに最大10件のEmbed）/ digest（1回の実行分を1つのまとめEmbedに）
+POST_FORMAT = os.getenv("POST_FORMAT", "batch").lower()
+# 1メッセージに含められるEmbedの最大数と、Embedの説明文の最大文字数（Discordの上限）
+DISCORD_MAX_EMBEDS_PER_MESSAGE = 10
+DISCORD_EMBED_DESCRIPTION_LIMIT = 4096
+
+
+def _has_module(name: str) -> bool:
+    """モジュールがインストールされているか"""
+    return importlib.util.find_spec(name) is not None
+
+
+def resolve_html_parsers(preference: str = HTML_PARSER) -> tuple:
+    """BeautifulSoupに渡すパーサー名と、記事本文の抽出にselectolaxを使うかどうかを決める"""
+    use_selectolax = preference in ('auto', 'selectolax') and _has_module('selectolax')
+    if preference == 'selectolax' and not use_selectolax:
+        logger.warning("selectolaxがインストールされていないため、記事本文の抽出にはBeautifulSoupを使用します")
+    if preference == 'html.parser':
+        soup_parser = 'html.parser'
+    elif _has_module('lxml'):
+        soup_parser = 'lxml'
+    else:
+        if preference == 'lxml':
+            logger.warning("lxmlがインストールされていないため、html.parserを使用します")
+        soup_parser = 'html.parser'
+    return soup_parser, use_selectolax
+
+
+class KeywordMatcher:
+    """Aho–Corasick法による複数キーワードの一括検索
+    
+    キーワードをカテゴリごとに登録しておき、テキストを1回走査するだけで、
+    重なりを含むすべての一致を (開始位置, 終了位置, キーワード, カテゴリ) で返す。
+    検索にかかる時間はキーワード数によらずテキストの長さに比例する。
+    """
+    
+    def __init__(self, keywords_by_category: Dict[str, List[str]]):
+        # ノードごとの遷移先（文字 → ノード番号）、失敗時の遷移先、そのノードで一致するキーワード
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._outputs: List[List[Tuple[str, str]]] = [[]]
+        for category, keywords in keywords_by_category.items():
+            for keyword in keywords:
+                self._add(keyword, category)
+        self._build_failure_links()
+    
+    def _add(self, keyword: str, category: str):
+        """キーワードをトライ木に追加"""
+        node = 0
+        for char in keyword:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append([])
+            node = next_node
+        if (keyword, category) not in self._outputs[node]:
+            self._outputs[node].append((keyword, category))
+    
+    def _build_failure_links(self):
+        """幅優先で失敗時の遷移先を設定し、接尾辞として含まれるキーワードの一致を引き継ぐ"""
+        queue = list(self._goto[0].values())
+        for node in queue:
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                self._outputs[child] = self._outputs[child] + self._outputs[self._fail[child]]
+    
+    def find_all(self, text: str) -> List[Tuple[int, int, str, str]]:
+        """テキスト中のすべての一致を (開始位置, 終了位置, キーワード, カテゴリ) のリストで返す"""
+        matches = []
+        if not text:
+            return matches
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        node = 0
+        for index, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for keyword, category in outputs[node]:
+                matches.append((index + 1 - len(keyword), index + 1, keyword, category))
+        return matches
+    
+    def categories(self, text: str) -> Dict[str, List[str]]:
+        """テキスト中で一致したキーワードをカテゴリごとに返す"""
+        found: Dict[str, List[str]] = {}
+        for _, _, keyword, category in self.find_all(text):
+            found.setdefault(category, []).append(keyword)
+        return found
+
+
+# 都内判定・新店判定・除外判定のキーワードをまとめた検索器（起動時に1回だけ構築）
+KEYWORD_MATCHER = KeywordMatcher({
+    'tokyo': TOKYO_KEYWORDS,
+    'store': STORE_KEYWORDS,
+    'opening': OPENING_KEYWORDS,
+    'exclude': EXCLUDE_KEYWORDS,
+    'non_tokyo': NON_TOKYO_PLACES
+})
+
+
+class OpeningDateExtractor:
+    """テキストからオープン日を抽出する（正規表現は構築時に1回だけコンパイル）
+    
+    キーワードの出現位置を求めたあと、キーワードの直後の範囲をまとめて1回だけ走査して
+    日付の候補を集め、その結果だけから判定する。全角の数字・区切り文字・コロンも半角と同じに扱い、
+    一致した日付だけをNFKC正規化して出力する（本文全体のNFKC正規化は抽出そのものより重いため行わない）。
+    令和の日付は西暦に変換する。
+    
+    判定の優先順位:
+    - キーワードは優先順位順に、最初に出現した位置の直後300文字を探す
+    - 日付は「YYYY年M月D日」→「YYYY/M/D」→「YYYY.M.D」→「YYYY-M-D」→「YYYY年M月D」の順に優先し、
+      同じ形式なら先に出現したものを選ぶ
+    - どのキーワードの直後にも日付がなく、本文に「オープン日」「開店日」があれば本文全体から探す
+    """
+    
+    # オープン日関連のキーワード（優先順位順）
+    KEYWORDS = ['オープン日：', 'オープン日', '開店日：', '開店日', 'オープン', '開店']
+    # キーワードの直後に日付を探す範囲（文字数）
+    WINDOW = 300
+    # 本文全体から日付を探す条件となるキーワード
+    FALLBACK_KEYWORDS = ['オープン日', '開店日']
+    # 令和元年の前年（令和N年 = 2018 + N年）
+    REIWA_OFFSET = 2018
+    
+    DATE_PATTERN = (
+        r'(?:(?P<year>\d{4})|(?:令和|㋿)(?P<reiwa>元|\d{1,2}))年(?P<jmonth>\d{1,2})月(?P<jday>\d{1,2})(?P<day_suffix>日)?'
+        r'|(?P<syear>\d{4})[/／](?P<smonth>\d{1,2})[/／](?P<sday>\d{1,2})'
+        r'|(?P<dyear>\d{4})[.．](?P<dmonth>\d{1,2})[.．](?P<dday>\d{1,2})'
+        r'|(?P<hyear>\d{4})[-－](?P<hmonth>\d{1,2})[-－](?P<hday>\d{1,2})'
+    )
+    # 区切り文字ごとの優先順位と年月日のグループ名（「年月日」は0、日の無い「年月」は4）
+    SEPARATED_FORMATS = [(1, 'syear', 'smonth', 'sday'), (2, 'dyear', 'dmonth', 'dday'), (3, 'hyear', 'hmonth', 'hday')]
+    
+    def __init__(self):
+        # 半角コロンの表記ゆれも含めたキーワードの一覧（優先順位順）
+        self._keyword_variants = [
+            (keyword, sorted({keyword, keyword.replace('：', ':')}))
+            for keyword in self.KEYWORDS
+        ]
+        self._date = re.compile(self.DATE_PATTERN)
+        # 日付の書き出し（4桁の年+区切り、または令和）。自身と重なって出現しないので、
+        # 重ならない一致だけで全出現を拾える
+        self._date_start = re.compile(r'(?=[令㋿\d])(?:\d{4}[年/.\-／．－]|令和|㋿)')
+    
+    def extract(self, text: str) -> Optional[str]:
+        """テキストからオープン日をYYYY-MM-DD形式で抽出（見つからなければNone）"""
+        if not text:
+            return None
+        
+        # キーワードごとの初出位置の直後WINDOW文字を探索範囲とする
+        windows = []
+        for keyword, variants in self._keyword_variants:
+            positions = [position for position in (text.find(variant) for variant in variants) if position != -1]
+            if positions:
+                start = min(positions) + len(keyword)
+                windows.append((start, min(len(text), start + self.WINDOW)))
+        
+        if windows:
+            # すべての探索範囲を覆う区間を1回だけ走査して日付の候補を集める
+            dates = self._scan_dates(text, min(start for start, _ in windows), max(end for _, end in windows))
+            for start, end in windows:
+                date = self._best_date(text, dates, start, end)
+                if date:
+                    return self._format(date)
+        
+        if any(keyword in text for keyword in self.FALLBACK_KEYWORDS):
+            date = self._best_date(text, self._scan_dates(text, 0, len(text)), 0, len(text))
+            if date:
+                return self._format(date)
+        
+        return None
+    
+    def _scan_dates(self, text: str, start: int, end: int) -> List[Tuple[int, int, re.Match]]:
+        """text[start:end] に含まれる日付を (開始位置, 終了位置, 一致) のリストで返す"""
+        dates = []
+        for match in self._date_start.finditer(text, start, end):
+            date = self._date.match(text, match.start(), end)
+            if date:
+                dates.append((match.start(), date.end(), date))
+        return dates
+    
+    def _best_date(self, text: str, dates: List[Tuple[int, int, re.Match]], start: int, end: int) -> Optional[re.Match]:
+        """text[start:end] の範囲の日付のうち、最も優先度の高い形式で最も前にあるものを返す"""
+        best = None
+        for date_start, date_end, date in dates:
+            if date_start < start:
+                continue
+            if date_start >= end:
+                break
+            if date_end > end:
+                # 範囲の終わりで途切れる日付は、途切れた位置までで一致するかを調べ直す
+                date = self._date.match(text, date_start, end)
+            if date:
+                candidate = (self._rank(date), date_start, date)
+                if best is None or candidate[:2] < best[:2]:
+                    best = candidate
+        return best[2] if best else None
+    
+    def _rank(self, date: re.Match) -> int:
+        """日付の形式の優先順位（小さいほど優先）"""
+        for rank, year_group, _, _ in self.SEPARATED_FORMATS:
+            if date.group(year_group):
+                return rank
+        return 0 if date.group('day_suffix') else 4
+    
+    def _format(self, date: re.Match) -> str:
+        """一致した日付をYYYY-MM-DD形式に統一"""
+        for _, year_group, month_group, day_group in self.SEPARATED_FORMATS:
+            if date.group(year_group):
+                year, month, day = date.group(year_group, month_group, day_group)
+                break
+        else:
+            year, month, day = date.group('year', 'jmonth', 'jday')
+            reiwa = date.group('reiwa')
+            if reiwa is not None:
+                year = str(self.REIWA_OFFSET + (1 if reiwa == '元' else int(reiwa)))
+        year, month, day = (unicodedata.normalize('NFKC', part) for part in (year, month, day))
+        return f"{year}-{month.zfill(2)}-{day.zfill(2)}"
+
+
+OPENING_DATE_EXTRACTOR = OpeningDateExtractor()
+
+
+class TokyoAddressResolver:
+    """テキスト中の住所から都内かどうかと区市町村を判定する
+    
+    郵便番号・「東京都＋区市町村名」・区市町村名を1つの正規表現で1回だけ走査し、
+    都内と断定できる最初の一致で判定を終える。
+    """
+    
+    # 住所として抜き出す文字数（一致した位置から）
+    ADDRESS_LENGTH = 60
+    
+    def __init__(self, municipalities: List[str], ambiguous: Set[str], postal_prefixes: Dict[str, str],
+                 shared_postal_areas: Set[str], other_prefectures: List[str]):
+        self.ambiguous = ambiguous
+        self.postal_prefixes = postal_prefixes
+        self.shared_postal_areas = shared_postal_areas
+        # 郵便番号の直後に他の道府県名が続けば都外の住所
+        self._other_prefecture = re.compile(
+            r'\s*(?:' + '|'.join(re.escape(name) for name in other_prefectures) + ')'
+        )
+        # 「ヶ」と「ケ」の表記ゆれは正式名称に揃える
+        self._canonical = {name.replace('ヶ', 'ケ'): name for name in municipalities}
+        names = '|'.join(
+            re.escape(name).replace('ヶ', '[ヶケ]')
+            for name in sorted(municipalities, key=len, reverse=True)
+        )
+        self._pattern = re.compile(
+            rf'(?<![\d\-])(?:〒\s*(?P<postal>\d{{3}}-?\d{{4}})|(?P<postal_hyphen>\d{{3}}-\d{{4}}))(?![\d\-])'
+            rf'|(?P<prefecture>東京都)\s*(?P<prefecture_municipality>{names})?'
+            rf'|(?P<municipality>{names})'
+        )
+    
+    def resolve(self, text: str) -> Optional[Dict]:
+        """都内の住所が見つかれば {'municipality': 区市町村（不明ならNone）, 'evidence': 根拠, 'address': 住所部分} を返す
+        
+        都内と断定した一致で区市町村が分からない場合（「東京都」のみなど）は、
+        続きから区市町村名だけを探して補う
+        """
+        if not text:
+            return None
+        matches = self._pattern.finditer(text)
+        result = self._first_tokyo_match(text, matches)
+        if result and not result['municipality']:
+            for match in matches:
+                municipality = self._normalize(match.group('prefecture_municipality') or match.group('municipality'))
+                if municipality and municipality not in self.ambiguous:
+                    result['municipality'] = municipality
+                    break
+        return result
+    
+    def _first_tokyo_match(self, text: str, matches: Iterator[re.Match]) -> Optional[Dict]:
+        """都内と断定できる最初の一致を返す"""
+        for match in matches:
+            postal = match.group('postal') or match.group('postal_hyphen')
+            if postal:
+                digits = postal.replace('-', '')
+                municipality = self._municipality_from_postal(digits)
+                if not municipality and digits[:3] not in self.shared_postal_areas:
+                    continue
+                if self._other_prefecture.match(text, match.end()):
+                    continue
+                # 郵便番号に続く住所に区市町村名があれば、先頭桁からの推定より優先する
+                municipality = self._municipality_after(text, match.end()) or municipality
+                evidence = 'postal'
+            elif match.group('prefecture'):
+                municipality = self._normalize(match.group('prefecture_municipality'))
+                evidence = 'prefecture'
+            else:
+                municipality = self._normalize(match.group('municipality'))
+                if municipality in self.ambiguous:
+                    continue
+                evidence = 'municipality'
+            return {
+                'municipality': municipality,
+                'evidence': evidence,
+                'address': text[match.start():match.start() + self.ADDRESS_LENGTH]
+            }
+        return None
+    
+    def _municipality_after(self, text: str, start: int) -> Optional[str]:
+        """位置start以降の住所部分にある区市町村名（「東京都」に続くもの、または同名の無いもの）を返す"""
+        window = text[start:start + self.ADDRESS_LENGTH]
+        for match in self._pattern.finditer(window):
+            municipality = self._normalize(match.group('prefecture_municipality'))
+            if municipality:
+                return municipality
+            municipality = self._normalize(match.group('municipality'))
+            if municipality and municipality not in self.ambiguous:
+                return municipality
+        return None
+    
+    def _municipality_from_postal(self, digits: str) -> Optional[str]:
+        """郵便番号の先頭桁から区市町村を求める（長い先頭桁の対応を優先）"""
+        for length in (5, 4, 3):
+            municipality = self.postal_prefixes.get(digits[:length])
+            if municipality:
+                return municipality
+        return None
+    
+    def _normalize(self, name: Optional[str]) -> Optional[str]:
+        if not name:
+            return None
+        return self._canonical.get(name.replace('ヶ', 'ケ'), name)
+
+
+TOKYO_ADDRESS_RESOLVER = TokyoAddressResolver(
+    TOKYO_MUNICIPALITIES, AMBIGUOUS_MUNICIPALITIES, TOKYO_POSTAL_PREFIXES,
+    TOKYO_SHARED_POSTAL_AREAS, OTHER_PREFECTURES
+)
+
+
+@dataclass(slots=True)
+class NewsItem:
+    """ニュース一覧の記事1件
+    
+    判定や履歴の確認で何度も使う「タイトル＋本文」、日付、投稿履歴のキーは
+    初回に計算して保持する（date / title / text は作成後に変更しない前提）
+    """
+    date: str
+    title: str
+    url: str
+    text: str = ''
+    # 詳細ページから抽出したオープン日（YYYY-MM-DD）と区市町村
+    opening_date: Optional[str] = None
+    ward: Optional[str] = None
+    _combined_text: Optional[str] = field(default=None, init=False, repr=False, compare=False)
+    _published: Optional[datetime] = field(default=None, init=False, repr=False, compare=False)
+    _history_key: Optional[str] = field(default=None, init=False, repr=False, compare=False)
+    
+    @property
+    def combined_text(self) -> str:
+        """キーワード判定に使う「タイトル 本文」"""
+        if self._combined_text is None:
+            self._combined_text = f"{self.title} {self.text}"
+        return self._combined_text
+    
+    @property
+    def published(self) -> datetime:
+        """記事の日付（YYYY-MM-DD形式でなければValueError）"""
+        if self._published is None:
+            self._published = datetime.strptime(self.date, '%Y-%m-%d')
+        return self._published
+    
+    @property
+    def history_key(self) -> str:
+        """投稿履歴のキー（日付とタイトルの組み合わせ）"""
+        if self._history_key is None:
+            self._history_key = f"{self.date}_{self.title}"
+        return self._history_key
+
+
+class HttpCache:
+    """ETag / Last-Modified を使ったディスク上のHTTPキャッシュ
+    
+    本文は <cache_dir>/<URLのハッシュ>.body に、検証子と保存日時は index.json に保存する
+    """
+    
+    def __init__(self, cache_dir: Path, max_age_days: int = 30, max_bytes: int = 50 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_age_days = max_age_days
+        self.max_bytes = max_bytes
+        self.index_file = cache_dir / "index.json"
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.entries: Dict[str, Dict] = self._load_index()
+    
+    def _load_index(self) -> Dict[str, Dict]:
+        """キャッシュのインデックスを読み込む"""
+        if not self.index_file.exists():
+            return {}
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.warning(f"HTTPキャッシュのインデックス読み込みエラー: {e}")
+            return {}
+    
+    def _body_file(self, url: str) -> Path:
+        return self.cache_dir / f"{hashlib.sha256(url.encode('utf-8')).hexdigest()}.body"
+    
+    def conditional_headers(self, url: str) -> Dict[str, str]:
+        """条件付きGET用のリクエストヘッダーを返す"""
+        with self._lock:
+            entry = self.entries.get(url)
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+    
+    def read(self, url: str) -> Optional[bytes]:
+        """キャッシュ済みの本文を返す（再検証はしない。本文が無ければNone）"""
+        try:
+            return self._body_file(url).read_bytes()
+        except OSError:
+            return None
+    
+    def revalidated(self, url: str) -> Optional[bytes]:
+        """304応答を受けたURLのキャッシュ済み本文を返す（本文が無ければNone）"""
+        try:
+            content = self._body_file(url).read_bytes()
+        except OSError:
+            with self._lock:
+                self.entries.pop(url, None)
+                self._dirty = True
+            return None
+        with self._lock:
+            if url in self.entries:
+                self.entries[url]['stored_at'] = datetime.now().isoformat()
+                self._dirty = True
+        return content
+    
+    def store(self, url: str, content: bytes, headers) -> None:
+        """検証子付きの応答を保存（検証子が無い応答は再検証できないので保存しない）"""
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        if not etag and not last_modified:
+            return
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            self._body_file(url).write_bytes(content)
+        except OSError as e:
+            logger.warning(f"HTTPキャッシュの保存エラー ({url}): {e}")
+            return
+        with self._lock:
+            self.entries[url] = {
+                'etag': etag,
+                'last_modified': last_modified,
+                'size': len(content),
+                'stored_at': datetime.now().isoformat()
+            }
+            self._dirty = True
+    
+    def prune(self):
+        """保持期間を過ぎたエントリを削除し、最大サイズに収まるまで古い順に削除"""
+        cutoff = (datetime.now() - timedelta(days=self.max_age_days)).isoformat()
+        with self._lock:
+            # 保存日時の新しい順に並べ、期限切れとサイズ超過分を削除対象にする
+            ordered = sorted(self.entries.items(), key=lambda kv: kv[1].get('stored_at', ''), reverse=True)
+            total = 0
+            removed = []
+            for url, entry in ordered:
+                total += entry.get('size', 0)
+                if entry.get('stored_at', '') < cutoff or total > self.max_bytes:
+                    removed.append(url)
+            for url in removed:
+                del self.entries[url]
+                self._body_file(url).unlink(missing_ok=True)
+            if removed:
+                self._dirty = True
+                logger.info(f"HTTPキャッシュから{len(removed)}件を削除しました")
+    
+    def save(self):
+        """期限切れエントリを整理してインデックスを保存"""
+        self.prune()
+        with self._lock:
+            if not self._dirty:
+                return
+            try:
+                self.cache_dir.mkdir(parents=True, exist_ok=True)
+                tmp_file = self.index_file.with_suffix('.tmp')
+                with open(tmp_file, 'w', encoding='utf-8') as f:
+                    json.dump(self.entries, f, ensure_ascii=False)
+                os.replace(tmp_file, self.index_file)
+                self._dirty = False
+            except OSError as e:
+                logger.warning(f"HTTPキャッシュのインデックス保存エラー: {e}")
+
+
+class CrawlerState:
+    """実行をまたいで保持するクローラーの状態（JSONファイル）
+    
+    投稿履歴と同じくGITHUB_TOKEN / GIST_IDがあればGistに、DATABASE_URLがあればPostgreSQLにも保存し、
+    実行ごとにコンテナが作り直される環境（RenderのCron Jobsなど）でも状態を引き継ぐ。
+    リモートへの書き込みはflush()でまとめて行う
+    """
+    
+    def __init__(self, state_file: Path, remote: bool = True):
+        self.state_file = state_file
+        self.github_token = os.getenv("GITHUB_TOKEN") if remote else None
+        self.gist_id = os.getenv("GIST_ID") if remote else None
+        self.database_url = os.getenv("DATABASE_URL") if remote and not self.gist_id else None
+        self._dirty = False
+        self.data: Dict = self._load()
+        remote_data = self._load_remote()
+        if remote_data is not None:
+            self.data = remote_data
+    
+    def _load(self) -> Dict:
+        if not self.state_file.exists():
+            return {}
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.warning(f"クローラー状態ファイルの読み込みエラー: {e}")
+            return {}
+    
+    def _load_remote(self) -> Optional[Dict]:
+        """Gist / PostgreSQLから状態を読み込む（未設定・未保存・エラーの場合はNone）"""
+        try:
+            if self.github_token and self.gist_id:
+                response = requests.get(
+                    f"https://api.github.com/gists/{self.gist_id}",
+                    headers=HistoryManager.gist_headers(self.github_token),
+                    timeout=REQUEST_TIMEOUT
+                )
+                response.raise_for_status()
+                file_info = response.json().get("files", {}).get(CRAWLER_STATE_GIST_FILE)
+                return json.loads(file_info.get("content") or "{}") if file_info else None
+            if self.database_url:
+                import psycopg2
+                with psycopg2.connect(self.database_url) as conn, conn.cursor() as cur:
+                    cur.execute("""
+                        CREATE TABLE IF NOT EXISTS crawler_state (
+                            id TEXT PRIMARY KEY,
+                            data TEXT NOT NULL,
+                            updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+                        )
+                    """)
+                    cur.execute("SELECT data FROM crawler_state WHERE id = %s", ('default',))
+                    row = cur.fetchone()
+                return json.loads(row[0]) if row else None
+        except Exception as e:
+            logger.warning(f"クローラー状態のリモート読み込みエラー（ローカルの状態を使用）: {e}")
+        return None
+    
+    def get(self, key: str, default=None):
+        return self.data.get(key, default)
+    
+    def set(self, key: str, value):
+        """値を更新してファイルに保存"""
+        self.data[key] = value
+        self._dirty = True
+        try:
+            tmp_file = self.state_file.with_suffix('.tmp')
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(self.data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_file, self.state_file)
+        except OSError as e:
+            logger.warning(f"クローラー状態ファイルの保存エラー: {e}")
+    
+    def flush(self):
+        """変更があればGist / PostgreSQLに書き戻す"""
+        if not self._dirty or not (self.gist_id or self.database_url):
+            return
+        content = json.dumps(self.data, ensure_ascii=False, indent=2)
+        try:
+            if self.github_token and self.gist_id:
+                response = requests.patch(
+                    f"https://api.github.com/gists/{self.gist_id}",
+                    headers=HistoryManager.gist_headers(self.github_token),
+                    json={"files": {CRAWLER_STATE_GIST_FILE: {"content": content}}},
+                    timeout=REQUEST_TIMEOUT
+                )
+                response.raise_for_status()
+            elif self.database_url:
+                import psycopg2
+                with psycopg2.connect(self.database_url) as conn, conn.cursor() as cur:
+                    cur.execute("""
+                        INSERT INTO crawler_state (id, data, updated_at) VALUES (%s, %s, CURRENT_TIMESTAMP)
+                        ON CONFLICT (id) DO UPDATE SET data = EXCLUDED.data, updated_at = EXCLUDED.updated_at
+                    """, ('default', content))
+            self._dirty = False
+        except Exception as e:
+            logger.warning(f"クローラー状態のリモート保存エラー: {e}")
 
 
 class TenkaippinCrawler:
     """天下一品ニュースページのクローラー"""
     
-    def __init__(self):
+    def __init__(self, http_cache: Optional[HttpCache] = None, state: Optional[CrawlerState] = None):
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         })
+        if http_cache is None and HTTP_CACHE_DIR:
+            http_cache = HttpCache(
+                Path(HTTP_CACHE_DIR),
+                max_age_days=HTTP_CACHE_MAX_AGE_DAYS,
+                max_bytes=HTTP_CACHE_MAX_MB * 1024 * 1024
+            )
+        self.http_cache = http_cache
+        self.state = state if state is not None else CrawlerState(CRAWLER_STATE_FILE)
+        # check_index_changedで取得済みのニュース一覧ページと、確定待ちのフィンガープリント
+        self._index_content: Optional[bytes] = None
+        self._index_content_type: Optional[str] = None
+        self._pending_fingerprint: Optional[Dict] = None
+        # 今回処理した最新の記事（処理完了後にハイウォーターマークとして保存）
+        self._pending_watermark: Optional[Dict] = None
+        self.soup_parser, self.use_selectolax = resolve_html_parsers()
+        # 前回までに記事を抽出できたセレクタ（news_item: ニュース一覧の記事要素、article_body: 記事本文）
+        self._selectors: Dict = dict(self.state.get('selectors') or {})
+        # ホストごとに前回宣言されていた文字コード（文字コードの宣言がなくUTF-8でもないページに使う）
+        self._host_encodings: Dict[str, str] = dict(self.state.get('encodings') or {})
+        self._lock = threading.Lock()
+        self.start_run()
     
-    def fetch_news(self) -> List[Dict]:
-        """ニュースページから記事一覧を取得"""
+    def start_run(self):
+        """1回の実行分の詳細ページキャッシュと取得統計をリセット"""
+        with self._lock:
+            # 詳細ページのHTMLと抽出済み本文（key: URL）
+            self._detail_pages: Dict[str, Optional[str]] = {}
+            self._detail_texts: Dict[str, Optional[str]] = {}
+            # 取得中のURL（同じURLへの同時呼び出しは完了を待って結果を共有）
+            self._inflight: Dict[str, threading.Event] = {}
+            # 先読みしてまだ使われていないURL（初回の利用は要求・削減の件数に数えない）
+            self._prefetched: Set[str] = set()
+            # skipped: タイトル・一覧の本文から都外と判定でき、詳細ページの取得を省略した件数
+            self.fetch_stats = {'requested': 0, 'fetched': 0, 'saved': 0, 'not_modified': 0, 'skipped': 0}
+            # 詳細ページを取得できず判定できなかった記事（次回の実行で再確認する）
+            self.unresolved_items: List[NewsItem] = []
+            # PARSE_PROFILE有効時の解析統計（ページ数、合計時間、最大のピークメモリ）
+            self.parse_stats = {'pages': 0, 'seconds': 0.0, 'peak_bytes': 0}
+    
+    def finish_run(self, persist: bool = True):
+        """HTTPキャッシュとクローラーの状態を保存し、詳細ページ取得の統計をログに出力
+        
+        persist=Falseの場合はクローラーの状態をGist / PostgreSQLに書き戻さない（プレビュー用）
+        """
+        if self.http_cache:
+            self.http_cache.save()
+        if persist:
+            self.state.flush()
+        stats = self.fetch_stats
+        logger.info(
+            f"詳細ページ取得: 要求{stats['requested']}件 / "
+            f"実取得{stats['fetched']}件（うち未更新{stats['not_modified']}件） / "
+            f"重複取得の削減{stats['saved']}件 / 都外と判定して取得を省略{stats['skipped']}件"
+        )
+        if PARSE_PROFILE and self.parse_stats['pages']:
+            parse_stats = self.parse_stats
+            logger.info(
+                f"HTML解析: {parse_stats['pages']}ページ / 合計{parse_stats['seconds'] * 1000:.1f}ms / "
+                f"最大ピークメモリ{parse_stats['peak_bytes'] / 1024:.0f}KB（{self.soup_parser}）"
+            )
+    
+    @contextmanager
+    def _profile_parse(self, label: str):
+        """PARSE_PROFILE有効時に、ブロック内の解析時間とピークメモリを計測してログに出力
+        
+        ピークメモリはプロセス全体の値のため、並行して解析している場合は他の解析分も含む
+        """
+        if not PARSE_PROFILE:
+            yield
+            return
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            peak = max(tracemalloc.get_traced_memory()[1] - baseline, 0)
+            if started_tracing:
+                tracemalloc.stop()
+            with self._lock:
+                self.parse_stats['pages'] += 1
+                self.parse_stats['seconds'] += elapsed
+                self.parse_stats['peak_bytes'] = max(self.parse_stats['peak_bytes'], peak)
+            logger.info(f"解析 {label}: {elapsed * 1000:.1f}ms / ピークメモリ{peak / 1024:.0f}KB")
+    
+    def _parse_news_elements(self, html: str) -> List:
+        """ニュース一覧のHTMLから記事の要素を取り出す（記事要素の部分だけを解析）
+        
+        前回記事を抽出できたセレクタがあればその要素だけを解析し、見つからない場合のみ広範囲に探す
+        """
+        learned = self._selectors.get('news_item')
+        if learned:
+            soup = BeautifulSoup(html, self.soup_parser, parse_only=SoupStrainer(learned['name'], class_=learned['class']))
+            news_elements = soup.find_all(learned['name'], class_=learned['class'])
+            if any(self._element_date(element) for element in news_elements):
+                return news_elements
+            logger.info(f"学習済みのセレクタ {learned['name']}.{learned['class']} で記事が見つからないため、広範囲に検索します")
+        
+        soup = BeautifulSoup(html, self.soup_parser, parse_only=NEWS_ELEMENT_STRAINER)
+        news_elements = self._news_elements(soup)
+        if not news_elements:
+            # 記事要素のクラスが見つからない場合は、ページ全体を解析して日付から探す
+            return self._news_elements(BeautifulSoup(html, self.soup_parser))
+        return self._learn_news_selector(news_elements)
+    
+    def _learn_news_selector(self, news_elements: List) -> List:
+        """広範囲の検索結果から、記事を最も多く抽出できた要素名とクラスを学習して保存
+        
+        記事を入れ子で含む一覧全体のコンテナなども一致するため、学習したセレクタに
+        一致する要素だけを返す（学習できなければそのまま返す）
+        """
+        counts: Dict[Tuple[str, str], int] = {}
+        for element in news_elements:
+            if not self._element_date(element) or not element.find('a', href=True):
+                continue
+            for css_class in element.get('class', []):
+                if NEWS_CLASS_PATTERN.search(css_class):
+                    key = (element.name, css_class)
+                    counts[key] = counts.get(key, 0) + 1
+        if not counts:
+            return news_elements
+        
+        # 記事数が同じなら、より内側（記事1件ごと）の要素を選ぶ
+        name, css_class = max(counts, key=lambda key: (counts[key], key[0] == 'li', key[0] == 'article'))
+        self._remember_selector('news_item', {'name': name, 'class': css_class})
+        return [element for element in news_elements
+                if element.name == name and css_class in element.get('class', [])]
+    
+    def _remember_selector(self, kind: str, selector):
+        """記事を抽出できたセレクタを記録し、変わった場合のみ状態ファイルに保存"""
+        with self._lock:
+            if self._selectors.get(kind) == selector:
+                return
+            self._selectors[kind] = selector
+            self.state.set('selectors', dict(self._selectors))
+        logger.info(f"セレクタを学習しました ({kind}): {selector}")
+    
+    def check_index_changed(self) -> bool:
+        """ニュース一覧ページが前回の実行から変わったかどうかを解析前に判定
+        
+        HTTPの検証子で条件付きGETを行い、304なら未変更とする。
+        200の場合もニュース一覧部分のハッシュが前回と同じなら未変更とする。
+        """
+        if not SKIP_UNCHANGED_INDEX:
+            return True
+        
+        previous = self.state.get('index_fingerprint') or {}
+        headers = {}
+        if previous.get('etag'):
+            headers['If-None-Match'] = previous['etag']
+        if previous.get('last_modified'):
+            headers['If-Modified-Since'] = previous['last_modified']
+        
         try:
-            response = self.session.get(NEWS_URL, timeout=10)
+            response = self.session.get(NEWS_URL, headers=headers, timeout=REQUEST_TIMEOUT)
+            if response.status_code == 304 and previous.get('content_hash'):
+                return False
+            if response.status_code == 304:
+                response = self.session.get(NEWS_URL, timeout=REQUEST_TIMEOUT)
             response.raise_for_status()
-            response.encoding = response.apparent_encoding
+        except Exception as e:
+            logger.warning(f"ニュース一覧の変更確認エラー: {e}")
+            return True
+        
+        content_hash = hashlib.sha256(self._news_list_region(response.content)).hexdigest()
+        self._index_content = response.content
+        self._index_content_type = response.headers.get('Content-Type')
+        self._pending_fingerprint = {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'content_hash': content_hash
+        }
+        return content_hash != previous.get('content_hash')
+    
+    def _news_list_region(self, content: bytes) -> bytes:
+        """ページ全体から、最初の日付から最後の日付付近までのニュース一覧部分を切り出す"""
+        dates = list(re.finditer(rb'\d{4}\.\d{2}\.\d{2}', content))
+        if not dates:
+            return content
+        return content[dates[0].start():dates[-1].end() + 300]
+    
+    def commit_progress(self):
+        """処理が完了したニュース一覧のフィンガープリントとハイウォーターマークを保存"""
+        if self.unresolved_items:
+            # 判定できなかった記事を次回も処理対象にするため、フィンガープリントもハイウォーターマークも進めない
+            logger.warning(
+                f"詳細ページを取得できず判定できなかった記事が{len(self.unresolved_items)}件あるため、"
+                f"次回の実行で再確認します: {', '.join(item.title for item in self.unresolved_items)}"
+            )
+            self._pending_fingerprint = None
+            self._pending_watermark = None
+        if self._pending_fingerprint:
+            self.state.set('index_fingerprint', self._pending_fingerprint)
+            self._pending_fingerprint = None
+        if self._pending_watermark:
+            self.state.set('watermark', self._pending_watermark)
+            self._pending_watermark = None
+    
+    def _get_index_html(self) -> str:
+        """ニュース一覧ページを取得（check_index_changedで取得済みならそれを使う）"""
+        content, content_type = self._index_content, self._index_content_type
+        self._index_content = self._index_content_type = None
+        if content is None:
+            response = self.session.get(NEWS_URL, timeout=REQUEST_TIMEOUT)
+            response.raise_for_status()
+            content, content_type = response.content, response.headers.get('Content-Type')
+        return self.decode_body(content, NEWS_URL, content_type)
+    
+    def _news_elements(self, soup: BeautifulSoup) -> List:
+        """ニュース一覧から記事の要素をページ順に取り出す"""
+        # ニュース記事を抽出（ページ構造に応じて調整が必要な場合あり）
+        # 日付とタイトルを含む要素を探す
+        news_elements = soup.find_all(['li', 'div', 'article'], class_=re.compile(r'news|item|entry', re.I))
+        
+        # もし特定のクラスが見つからない場合は、より広範囲に検索
+        if not news_elements:
+            # 日付パターン（YYYY.MM.DD形式）を含む要素を探す
+            date_pattern = re.compile(r'\d{4}\.\d{2}\.\d{2}')
+            for element in soup.find_all(text=date_pattern):
+                parent = element.find_parent()
+                if parent:
+                    news_elements.append(parent)
+        return news_elements
+    
+    def _element_date(self, element) -> Optional[str]:
+        """記事の要素から日付（YYYY-MM-DD形式）を抽出"""
+        date_match = re.search(r'(\d{4})\.(\d{2})\.(\d{2})', element.get_text())
+        if not date_match:
+            return None
+        return f"{date_match.group(1)}-{date_match.group(2)}-{date_match.group(3)}"
+    
+    def _build_news_item(self, element, date_str: str, base_url: Optional[str] = None) -> Optional[NewsItem]:
+        """記事の要素からタイトル・URL・本文を抽出（タイトルが無ければNone）"""
+        # タイトルを抽出
+        title_elem = element.find(['a', 'h3', 'h2', 'h4'])
+        if not title_elem:
+            # テキストからタイトルを抽出
+            title_text = element.get_text(strip=True)
+            # 日付部分を除いたテキストをタイトルとする
+            title = re.sub(r'\d{4}\.\d{2}\.\d{2}\s*', '', title_text).strip()
+        else:
+            title = title_elem.get_text(strip=True)
+        
+        # URLを抽出
+        link_elem = element.find('a', href=True)
+        if link_elem:
+            url = urljoin(base_url or NEWS_URL, link_elem['href'])
+        else:
+            url = NEWS_URL
+        
+        if not title:
+            return None
+        return NewsItem(date=date_str, title=title, url=url, text=element.get_text(strip=True))
+    
+    def iter_new_news(self, days: int) -> Iterator[NewsItem]:
+        """直近N日以内で、前回処理した記事より新しい記事をページ順に1件ずつ返す
+        
+        ハイウォーターマーク（前回処理した最新記事）に到達するか、古い記事が続いたら
+        打ち切るので、それより後ろの記事はタイトル等の抽出も判定もしない
+        """
+        cutoff_date = datetime.now() - timedelta(days=days)
+        watermark = self.state.get('watermark') if INCREMENTAL_CRAWL else None
+        html = self._get_index_html()
+        with self._profile_parse(NEWS_URL):
+            news_elements = self._parse_news_elements(html)
+        
+        seen_titles = set()
+        old_streak = 0
+        for element in news_elements:
+            try:
+                date_str = self._element_date(element)
+                if not date_str:
+                    continue
+                
+                is_old = datetime.strptime(date_str, '%Y-%m-%d') < cutoff_date
+                if watermark and date_str < watermark['date']:
+                    is_old = True
+                if is_old:
+                    old_streak += 1
+                    if old_streak >= INCREMENTAL_STOP_TOLERANCE:
+                        break
+                    continue
+                old_streak = 0
+                
+                item = self._build_news_item(element, date_str)
+            except Exception as e:
+                logger.warning(f"記事の解析中にエラー: {e}")
+                continue
             
-            soup = BeautifulSoup(response.text, 'html.parser')
-            news_items = []
+            if not item or item.title in seen_titles:
+                continue
+            if watermark and (item.date, item.url) == (watermark['date'], watermark['url']):
+                logger.info(f"前回処理済みの記事に到達しました: {item.title}")
+                break
+            seen_titles.add(item.title)
             
-            # ニュース記事を抽出（ページ構造に応じて調整が必要な場合あり）
-            # 日付とタイトルを含む要素を探す
-            news_elements = soup.find_all(['li', 'div', 'article'], class_=re.compile(r'news|item|entry', re.I))
+            if self._pending_watermark is None or item.date > self._pending_watermark['date']:
+                self._pending_watermark = {'date': item.date, 'url': item.url}
+            yield item
+    
+    def iter_archive_pages(self, start_url: str = NEWS_URL, interval: float = 0) -> Iterator[Dict]:
+        """ニュース一覧を「次のページ」リンクをたどって1ページずつ取得
+        
+        ページごとに {'url': ページURL, 'items': 記事のリスト, 'next_url': 次のページのURL} を返す。
+        次のページを取得する前にinterval秒待つ。
+        """
+        url = start_url
+        visited = set()
+        while url and url not in visited:
+            visited.add(url)
+            response = self.session.get(url, timeout=REQUEST_TIMEOUT)
+            response.raise_for_status()
+            html = self.decode_body(response.content, url, response.headers.get('Content-Type'))
+            with self._profile_parse(url):
+                news_elements = self._parse_news_elements(html)
+                next_url = self._next_page_url(BeautifulSoup(html, self.soup_parser, parse_only=LINK_STRAINER), url)
+            
+            items = []
+            seen_titles = set()
+            for element in news_elements:
+                try:
+                    date_str = self._element_date(element)
+                    if not date_str:
+                        continue
+                    item = self._build_news_item(element, date_str, base_url=url)
+                except Exception as e:
+                    logger.warning(f"記事の解析中にエラー: {e}")
+                    continue
+                if item and item.title not in seen_titles:
+                    seen_titles.add(item.title)
+                    items.append(item)
             
-            # もし特定のクラスが見つからない場合は、より広範囲に検索
-            if not news_elements:
-                # 日付パターン（YYYY.MM.DD形式）を含む要素を探す
-                date_pattern = re.compile(r'\d{4}\.\d{2}\.\d{2}')
-                for element in soup.find_all(text=date_pattern):
-                    parent = element.find_parent()
-                    if parent:
-                        news_elements.append(parent)
+            yield {'url': url, 'items': items, 'next_url': next_url}
+            
+            url = next_url
+            if url and interval:
+                time.sleep(interval)
+    
+    def _next_page_url(self, soup: BeautifulSoup, page_url: str) -> Optional[str]:
+        """ページ送りから次のページのURLを探す"""
+        link = soup.find(['a', 'link'], rel='next', href=True)
+        if not link:
+            for a in soup.find_all('a', href=True):
+                classes = ' '.join(a.get('class', []))
+                if a.get_text(strip=True) in NEXT_PAGE_TEXTS or re.search(r'next', classes, re.I):
+                    link = a
+                    break
+        if not link:
+            return None
+        return urljoin(page_url, link['href'])
+    
+    def fetch_news(self) -> List[NewsItem]:
+        """ニュースページから記事一覧を取得"""
+        try:
+            html = self._get_index_html()
+            with self._profile_parse(NEWS_URL):
+                news_elements = self._parse_news_elements(html)
+            news_items = []
             
             for element in news_elements:
                 try:
-                    # 日付を抽出
-                    date_text = element.get_text()
-                    date_match = re.search(r'(\d{4})\.(\d{2})\.(\d{2})', date_text)
-                    if not date_match:
+                    date_str = self._element_date(element)
+                    if not date_str:
                         continue
                     
-                    date_str = f"{date_match.group(1)}-{date_match.group(2)}-{date_match.group(3)}"
-                    
-                    # タイトルを抽出
-                    title_elem = element.find(['a', 'h3', 'h2', 'h4'])
-                    if not title_elem:
-                        # テキストからタイトルを抽出
-                        title_text = element.get_text(strip=True)
-                        # 日付部分を除いたテキストをタイトルとする
-                        title = re.sub(r'\d{4}\.\d{2}\.\d{2}\s*', '', title_text).strip()
-                    else:
-                        title = title_elem.get_text(strip=True)
-                    
-                    # URLを抽出
-                    link_elem = element.find('a', href=True)
-                    if link_elem:
-                        url = urljoin(NEWS_URL, link_elem['href'])
-                    else:
-                        url = NEWS_URL
-                    
-                    if title:
-                        news_items.append({
-                            'date': date_str,
-                            'title': title,
-                            'url': url,
-                            'text': element.get_text(strip=True)
-                        })
+                    item = self._build_news_item(element, date_str)
+                    if item:
+                        news_items.append(item)
                 
                 except Exception as e:
                     logger.warning(f"記事の解析中にエラー: {e}")
@@ -132,8 +1204,8 @@ class TenkaippinCrawler:
             seen_titles = set()
             unique_items = []
             for item in news_items:
-                if item['title'] not in seen_titles:
-                    seen_titles.add(item['title'])
+                if item.title not in seen_titles:
+                    seen_titles.add(item.title)
                     unique_items.append(item)
             
             logger.info(f"{len(unique_items)}件のニュース記事を取得しました")
@@ -144,192 +1216,459 @@ class TenkaippinCrawler:
             return []
     
     def fetch_article_detail(self, url: str) -> Optional[str]:
-        """記事詳細ページから本文を取得"""
+        """記事詳細ページから本文を取得（同じ実行内では1URLにつき1回だけ取得）"""
+        with self._lock:
+            if url in self._detail_texts:
+                if url in self._prefetched:
+                    # 先読みした本文の初回の利用（要求は先読み時に数えている）
+                    self._prefetched.discard(url)
+                else:
+                    self.fetch_stats['requested'] += 1
+                    self.fetch_stats['saved'] += 1
+                return self._detail_texts[url]
+            self.fetch_stats['requested'] += 1
+            event = self._inflight.get(url)
+            is_owner = event is None
+            if is_owner:
+                event = threading.Event()
+                self._inflight[url] = event
+        
+        if not is_owner:
+            # 他の呼び出しが取得中なので、その結果を待って共有する
+            event.wait()
+            with self._lock:
+                self.fetch_stats['saved'] += 1
+                return self._detail_texts.get(url)
+        
+        html = None
         try:
-            response = self.session.get(url, timeout=10)
-            response.raise_for_status()
-            response.encoding = response.apparent_encoding
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
-            # 本文を取得（一般的な記事本文のセレクタを試す）
-            content_selectors = [
-                'article', '.article', '.content', '.post-content',
-                '.entry-content', 'main', '.main-content'
-            ]
-            
-            for selector in content_selectors:
-                content = soup.select_one(selector)
-                if content:
-                    return content.get_text(strip=True)
-            
-            # セレクタが見つからない場合はbody全体から取得
-            body = soup.find('body')
-            if body:
-                return body.get_text(strip=True)
-            
-            return None
+            html = self._download_article(url)
+        finally:
+            text = self._store_detail(url, html)
+            with self._lock:
+                del self._inflight[url]
+            event.set()
+        return text
+    
+    def _download_article(self, url: str) -> Optional[str]:
+        """記事詳細ページのHTMLを取得（キャッシュがあれば条件付きGETで再検証）"""
+        try:
+            return self.decode_body(*self._get_cached(url))
         except Exception as e:
             logger.warning(f"記事詳細の取得エラー ({url}): {e}")
             return None
     
-    def extract_address_from_text(self, text: str) -> Optional[str]:
-        """テキストから住所情報を抽出"""
-        if not text:
+    def _get_cached(self, url: str) -> Tuple[bytes, str, Optional[str]]:
+        """HTTPキャッシュを使ってURLの本文を取得し、(本文, URL, Content-Type) を返す"""
+        headers = self.http_cache.conditional_headers(url) if self.http_cache else {}
+        response = self.session.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+        if response.status_code == 304:
+            content = self.http_cache.revalidated(url)
+            if content is not None:
+                with self._lock:
+                    self.fetch_stats['not_modified'] += 1
+                return content, url, None
+            # キャッシュの本文が失われていれば通常のGETで取り直す
+            response = self.session.get(url, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        if self.http_cache:
+            self.http_cache.store(url, response.content, response.headers)
+        return response.content, url, response.headers.get('Content-Type')
+    
+    def _store_detail(self, url: str, html: Optional[str]) -> Optional[str]:
+        """取得したHTMLから本文を抽出してキャッシュに保存"""
+        text = None
+        if html is not None:
+            try:
+                with self._profile_parse(url):
+                    text = self.parse_article_detail(html)
+            except Exception as e:
+                logger.warning(f"記事詳細の解析エラー ({url}): {e}")
+        with self._lock:
+            self.fetch_stats['fetched'] += 1
+            self._detail_pages[url] = html
+            self._detail_texts[url] = text
+        return text
+    
+    def decode_body(self, content: bytes, url: Optional[str] = None, content_type: Optional[str] = None) -> str:
+        """レスポンスボディをデコード
+        
+        Content-Typeのcharset、<meta charset>、UTF-8の順に試し、いずれでもデコードできない場合は
+        そのホストで前回宣言されていた文字コードを使う。それも使えない場合のみ本文全体から文字コードを推定する
+        （推定結果は誤っている可能性があるため記録しない）
+        """
+        url = url or NEWS_URL
+        host = urlsplit(url).netloc
+        candidates = [
+            (self._charset_param(content_type), True),
+            (self._meta_charset(content), True),
+            ('utf-8', True),
+            (self._host_encodings.get(host), False)
+        ]
+        tried = set()
+        for candidate, remember in candidates:
+            encoding = self._normalize_encoding(candidate)
+            if not encoding or encoding in tried:
+                continue
+            tried.add(encoding)
+            try:
+                text = content.decode(encoding)
+            except UnicodeDecodeError:
+                continue
+            if remember:
+                self._remember_encoding(host, encoding)
+            return text
+        
+        # 宣言された文字コードでデコードできない場合のみ推定する
+        encoding = self._normalize_encoding(chardet.detect(content)['encoding']) or 'utf-8'
+        logger.info(f"文字コードを推定しました ({url}): {encoding}")
+        return content.decode(encoding, errors='replace')
+    
+    @staticmethod
+    def _charset_param(content_type: Optional[str]) -> Optional[str]:
+        """Content-Typeヘッダーからcharsetを取り出す"""
+        if not content_type:
+            return None
+        match = re.search(r'charset=["\']?([A-Za-z0-9_\-]+)', content_type, re.I)
+        return match.group(1) if match else None
+    
+    @staticmethod
+    def _meta_charset(content: bytes) -> Optional[str]:
+        """ページ先頭の <meta charset> / <meta http-equiv="Content-Type"> からcharsetを取り出す"""
+        match = META_CHARSET_PATTERN.search(content[:META_CHARSET_SCAN_BYTES])
+        return match.group(1).decode('ascii') if match else None
+    
+    @staticmethod
+    def _normalize_encoding(name: Optional[str]) -> Optional[str]:
+        """文字コード名を正規化（Pythonで扱えない名前はNone）"""
+        if not name:
             return None
+        try:
+            encoding = codecs.lookup(name).name
+        except LookupError:
+            return None
+        return ENCODING_ALIASES.get(encoding, encoding)
+    
+    def _remember_encoding(self, host: str, encoding: str):
+        """ホストごとの文字コードを記録し、変わった場合のみ状態ファイルに保存"""
+        with self._lock:
+            if self._host_encodings.get(host) == encoding:
+                return
+            self._host_encodings[host] = encoding
+            self.state.set('encodings', dict(self._host_encodings))
+    
+    def parse_article_detail(self, html: str) -> Optional[str]:
+        """記事詳細ページのHTMLから本文を抽出
         
-        # 郵便番号パターン（〒123-4567 または 123-4567）
-        postal_pattern = r'[〒]?\d{3}-?\d{4}'
-        
-        # 都道府県パターン（東京都、大阪府など）
-        prefecture_pattern = r'[都道府県]+'
-        
-        # 住所らしいパターンを探す（郵便番号の前後、都道府県の前後）
-        # 郵便番号の前後100文字程度を抽出
-        postal_matches = list(re.finditer(postal_pattern, text))
-        for match in postal_matches:
-            start = max(0, match.start() - 50)
-            end = min(len(text), match.end() + 200)
-            address_candidate = text[start:end]
-            if '東京都' in address_candidate or '東京' in address_candidate:
-                return address_candidate
-        
-        # 都道府県パターンで検索
-        prefecture_matches = list(re.finditer(prefecture_pattern, text))
-        for match in prefecture_matches:
-            start = max(0, match.start() - 20)
-            end = min(len(text), match.end() + 100)
-            address_candidate = text[start:end]
-            if '東京都' in address_candidate:
-                return address_candidate
-        
-        # 「東京都」が含まれているか直接チェック
-        if '東京都' in text:
-            # 「東京都」の前後を抽出
-            tokyo_index = text.find('東京都')
-            if tokyo_index != -1:
-                start = max(0, tokyo_index - 20)
-                end = min(len(text), tokyo_index + 100)
-                return text[start:end]
+        前回本文を抽出できたセレクタ（未学習なら<article>）の要素だけを先に解析し、
+        見つからない場合のみページ全体で一般的な記事本文のセレクタを順に試す
+        """
+        if self.use_selectolax:
+            return self._parse_article_detail_selectolax(html)
+        
+        learned = self._selectors.get('article_body') or ARTICLE_CONTENT_SELECTORS[0]
+        if self._may_contain(html, learned):
+            soup = BeautifulSoup(html, self.soup_parser, parse_only=self._selector_strainer(learned))
+            content = soup.select_one(learned)
+            if content:
+                text = content.get_text(strip=True)
+                if text:
+                    self._remember_selector('article_body', learned)
+                    return text
+        
+        soup = BeautifulSoup(html, self.soup_parser)
+        for selector in ARTICLE_CONTENT_SELECTORS:
+            content = soup.select_one(selector)
+            if content:
+                text = content.get_text(strip=True)
+                if text:
+                    self._remember_selector('article_body', selector)
+                return text
+        
+        # セレクタが見つからない場合はbody全体から取得
+        body = soup.find('body')
+        if body:
+            return body.get_text(strip=True)
         
         return None
     
-    def extract_opening_date(self, text: str) -> Optional[str]:
-        """テキストからオープン日を抽出"""
-        if not text:
-            return None
+    @staticmethod
+    def _may_contain(html: str, selector: str) -> bool:
+        """セレクタ（タグ名または.クラス名）に一致する要素がHTMLに含まれうるかを文字列検索で判定"""
+        if selector.startswith('.'):
+            return selector[1:] in html
+        return re.search(rf'<{selector}[\s>]', html, re.I) is not None
+    
+    @staticmethod
+    def _selector_strainer(selector: str) -> SoupStrainer:
+        """セレクタ（タグ名または.クラス名）に一致する要素だけを解析するSoupStrainer"""
+        if selector.startswith('.'):
+            return SoupStrainer(class_=selector[1:])
+        return SoupStrainer(selector)
+    
+    def _parse_article_detail_selectolax(self, html: str) -> Optional[str]:
+        """selectolaxで記事詳細ページのHTMLから本文を抽出"""
+        from selectolax.parser import HTMLParser
         
-        # オープン日関連のキーワード（優先順位順）
-        opening_keywords = ['オープン日：', 'オープン日', '開店日：', '開店日', 'オープン', '開店']
-        
-        # 日付パターン（YYYY年MM月DD日(曜日)を含む）
-        # 「2025年11月17日(月)」のような形式に対応
-        date_patterns = [
-            r'(\d{4})年(\d{1,2})月(\d{1,2})日(?:\([月火水木金土日]\))?',  # 2025年11月17日(月) 形式
-            r'(\d{4})年(\d{1,2})月(\d{1,2})日',  # 2025年11月17日 形式
-            r'(\d{4})/(\d{1,2})/(\d{1,2})',
-            r'(\d{4})\.(\d{1,2})\.(\d{1,2})',
-            r'(\d{4})-(\d{1,2})-(\d{1,2})',
-            r'(\d{4})年(\d{1,2})月(\d{1,2})',
-        ]
+        tree = HTMLParser(html)
+        learned = self._selectors.get('article_body')
+        for selector in ([learned] if learned else []) + ARTICLE_CONTENT_SELECTORS:
+            content = tree.css_first(selector)
+            if content:
+                text = content.text(separator='', strip=True)
+                if text:
+                    self._remember_selector('article_body', selector)
+                    return text
+                if selector != learned:
+                    return text
         
-        # 各キーワードの周辺を検索（「オープン日：」のような明確なキーワードを優先）
-        for keyword in opening_keywords:
-            keyword_index = text.find(keyword)
-            if keyword_index != -1:
-                # キーワードの後ろ300文字を抽出（前は不要）
-                start = keyword_index + len(keyword)
-                end = min(len(text), start + 300)
-                context = text[start:end]
-                
-                # 日付パターンを検索（キーワードの直後にある日付を優先）
-                for pattern in date_patterns:
-                    match = re.search(pattern, context)
-                    if match:
-                        year, month, day = match.groups()[:3]  # 最初の3つのグループ（年、月、日）を取得
-                        # YYYY-MM-DD形式に統一
-                        return f"{year}-{month.zfill(2)}-{day.zfill(2)}"
-        
-        # キーワードが見つからない場合、「オープン日」という文字列の周辺を検索
-        if 'オープン日' in text or '開店日' in text:
-            # より広範囲で検索
-            for pattern in date_patterns:
-                matches = list(re.finditer(pattern, text))
-                if matches:
-                    # 最初に見つかった日付を返す
-                    match = matches[0]
-                    year, month, day = match.groups()[:3]
-                    return f"{year}-{month.zfill(2)}-{day.zfill(2)}"
+        if tree.body:
+            return tree.body.text(separator='', strip=True)
         
         return None
     
-    def is_tokyo_store(self, news_item: Dict) -> bool:
+    def needs_detail(self, news_item: NewsItem) -> bool:
+        """判定のために詳細ページの取得が必要な記事かどうか"""
+        url = news_item.url
+        if not url or url == NEWS_URL:
+            return False
+        matched = self.match_keywords(news_item.combined_text)
+        if 'store' not in matched or self.is_outside_tokyo(matched):
+            return False
+        return not self.is_excluded(news_item.title)
+    
+    @staticmethod
+    def match_keywords(text: str) -> Dict[str, List[str]]:
+        """テキスト中で一致したキーワードをカテゴリごとに返す
+        
+        都内キーワードの一部として一致した都外の地名（「東京都」の中の「京都」など）は除く
+        """
+        matches = KEYWORD_MATCHER.find_all(text)
+        tokyo_spans = [(start, end) for start, end, _, category in matches if category == 'tokyo']
+        found: Dict[str, List[str]] = {}
+        for start, end, keyword, category in matches:
+            if category == 'non_tokyo' and any(s <= start and end <= e for s, e in tokyo_spans):
+                continue
+            found.setdefault(category, []).append(keyword)
+        return found
+    
+    @staticmethod
+    def is_outside_tokyo(matched: Dict[str, List[str]]) -> bool:
+        """都内キーワードが無く、都外の道府県・都市名があれば、詳細ページを見るまでもなく都外と判定"""
+        return 'non_tokyo' in matched and 'tokyo' not in matched
+    
+    def is_excluded(self, title: str) -> bool:
+        """閉店・休業などのお知らせかどうか（開店を明示するキーワードがタイトルにあれば除外しない）"""
+        matched = KEYWORD_MATCHER.categories(title)
+        return 'exclude' in matched and 'opening' not in matched
+    
+    def extract_address_from_text(self, text: str) -> Optional[str]:
+        """テキストから都内の住所情報を抽出"""
+        address = TOKYO_ADDRESS_RESOLVER.resolve(text)
+        return address['address'] if address else None
+    
+    def extract_opening_date(self, text: str) -> Optional[str]:
+        """テキストからオープン日を抽出"""
+        return OPENING_DATE_EXTRACTOR.extract(text)
+    
+    def _apply_detail(self, news_item: NewsItem, detail_text: str, address: Optional[Dict] = None):
+        """詳細ページの本文からオープン日と区市町村を抽出してnews_itemに設定"""
+        opening_date = self.extract_opening_date(detail_text)
+        if opening_date:
+            news_item.opening_date = opening_date
+        if address is None:
+            address = TOKYO_ADDRESS_RESOLVER.resolve(detail_text)
+        if address and address['municipality']:
+            news_item.ward = address['municipality']
+    
+    def is_tokyo_store(self, news_item: NewsItem) -> bool:
         """ニュースが都内の新店情報かどうかを判定"""
-        title = news_item.get('title', '')
-        text = news_item.get('text', '')
-        combined_text = f"{title} {text}"
+        title = news_item.title
+        
+        # 新店・都内・除外・都外のキーワードを1回の走査でまとめて検索
+        matched = self.match_keywords(news_item.combined_text)
         
         # 新店関連のキーワードをチェック
-        store_keywords = ['オープン', '開店', '新店', '店舗', '店']
-        has_store_keyword = any(keyword in combined_text for keyword in store_keywords)
+        if 'store' not in matched:
+            return False
         
-        if not has_store_keyword:
+        # 閉店・休業のお知らせは除外
+        if self.is_excluded(title):
+            logger.info(f"閉店・休業などのお知らせのため除外: {title}")
             return False
         
         # まず、タイトル・本文に都内関連のキーワードがあるかチェック
-        for keyword in TOKYO_KEYWORDS:
-            if keyword in combined_text:
-                # 都内キーワードが見つかった場合でも、詳細ページからオープン日を抽出
-                url = news_item.get('url')
-                if url and url != NEWS_URL:
-                    detail_text = self.fetch_article_detail(url)
-                    if detail_text:
-                        opening_date = self.extract_opening_date(detail_text)
-                        if opening_date:
-                            news_item['opening_date'] = opening_date
-                return True
+        if 'tokyo' in matched:
+            logger.debug(f"都内キーワード {matched['tokyo']} に一致: {title}")
+            # 都内キーワードが見つかった場合でも、詳細ページからオープン日と区市町村を抽出
+            url = news_item.url
+            if url and url != NEWS_URL:
+                detail_text = self.fetch_article_detail(url)
+                if detail_text:
+                    self._apply_detail(news_item, detail_text)
+            return True
+        
+        # 都外の地名があれば、詳細ページを取得せずに都外と判定
+        if self.is_outside_tokyo(matched):
+            logger.info(f"都外の地名 {sorted(set(matched['non_tokyo']))} を含むため詳細ページの取得を省略: {title}")
+            with self._lock:
+                self.fetch_stats['skipped'] += 1
+            return False
         
         # タイトル・本文に都内キーワードがない場合、詳細ページをチェック
-        url = news_item.get('url')
+        url = news_item.url
         if url and url != NEWS_URL:
             logger.info(f"詳細ページをチェック: {title}")
             detail_text = self.fetch_article_detail(url)
             if detail_text:
-                # 詳細ページのテキストも含めて判定
-                full_text = f"{combined_text} {detail_text}"
-                
-                # 都内キーワードを再チェック（詳細ページのテキストも含む）
-                for keyword in TOKYO_KEYWORDS:
-                    if keyword in full_text:
-                        # オープン日を抽出してnews_itemに追加
-                        opening_date = self.extract_opening_date(detail_text)
-                        if opening_date:
-                            news_item['opening_date'] = opening_date
-                        return True
-                
-                # 住所情報から判定
-                address = self.extract_address_from_text(detail_text)
+                # 住所情報（都内の郵便番号、東京都＋区市町村名）から判定
+                address = TOKYO_ADDRESS_RESOLVER.resolve(detail_text)
                 if address:
-                    if '東京都' in address:
-                        logger.info(f"住所情報から都内と判定: {address[:50]}...")
-                        # オープン日を抽出してnews_itemに追加
-                        opening_date = self.extract_opening_date(detail_text)
-                        if opening_date:
-                            news_item['opening_date'] = opening_date
-                        return True
+                    logger.info(f"住所情報から都内と判定: {address['address']}...")
+                    self._apply_detail(news_item, detail_text, address)
+                    return True
+                
+                # 都内キーワードを詳細ページのテキストで再チェック
+                # （タイトル・本文は確認済みで、キーワードは空白をまたがないため詳細ページのみ走査）
+                detail_matched = KEYWORD_MATCHER.categories(detail_text)
+                if 'tokyo' in detail_matched:
+                    logger.debug(f"詳細ページの都内キーワード {detail_matched['tokyo']} に一致: {title}")
+                    self._apply_detail(news_item, detail_text)
+                    return True
+            else:
+                with self._lock:
+                    self.unresolved_items.append(news_item)
         
         return False
 
 
+class AsyncTenkaippinCrawler(TenkaippinCrawler):
+    """詳細ページをasyncioで並行取得するクローラー
+    
+    prefetch_detailsで必要な詳細ページをまとめて取得しておくと、
+    以降のis_tokyo_store / fetch_article_detailは取得済みの本文を使う
+    """
+    
+    def __init__(
+        self,
+        concurrency: int = CRAWLER_CONCURRENCY,
+        http_cache: Optional[HttpCache] = None,
+        state: Optional[CrawlerState] = None
+    ):
+        self.concurrency = concurrency
+        super().__init__(http_cache, state)
+    
+    def start_run(self):
+        """1回の実行分の詳細ページキャッシュと取得統計をリセット"""
+        super().start_run()
+        # 非同期で取得中のURL（key: URL, value: 本文を返すFuture）
+        self._async_inflight: Dict[str, asyncio.Future] = {}
+    
+    async def prefetch_details(self, news_items: List[NewsItem]):
+        """詳細ページが必要な記事の本文を並行して取得"""
+        urls = []
+        for item in news_items:
+            if self.needs_detail(item) and item.url not in urls:
+                urls.append(item.url)
+        
+        if not urls:
+            return
+        
+        # 同一ホストへの同時接続数を制限した接続プールを全リクエストで共有
+        connector = aiohttp.TCPConnector(limit_per_host=self.concurrency)
+        timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+        async with aiohttp.ClientSession(
+            connector=connector,
+            timeout=timeout,
+            headers=dict(self.session.headers)
+        ) as session:
+            await asyncio.gather(
+                *(self._fetch_article_detail_async(session, url) for url in urls)
+            )
+        
+        logger.info(f"詳細ページを{len(urls)}件並行取得しました（同時接続数: {self.concurrency}）")
+    
+    async def _fetch_article_detail_async(self, session: aiohttp.ClientSession, url: str) -> Optional[str]:
+        """記事詳細ページを非同期で取得して本文を抽出（同じURLの取得は1回だけ）"""
+        with self._lock:
+            self.fetch_stats['requested'] += 1
+            if url in self._detail_texts:
+                self.fetch_stats['saved'] += 1
+                return self._detail_texts[url]
+        
+        future = self._async_inflight.get(url)
+        if future is not None:
+            with self._lock:
+                self.fetch_stats['saved'] += 1
+            return await asyncio.shield(future)
+        
+        future = asyncio.get_running_loop().create_future()
+        self._async_inflight[url] = future
+        try:
+            html = await self._download_article_async(session, url)
+            text = self._store_detail(url, html)
+            with self._lock:
+                self._prefetched.add(url)
+            future.set_result(text)
+            return text
+        finally:
+            del self._async_inflight[url]
+            if not future.done():
+                future.cancel()
+    
+    async def _download_article_async(self, session: aiohttp.ClientSession, url: str) -> Optional[str]:
+        """記事詳細ページのHTMLを非同期で取得（キャッシュがあれば条件付きGETで再検証）"""
+        try:
+            return self.decode_body(*await self._get_cached_async(session, url))
+        except Exception as e:
+            logger.warning(f"記事詳細の取得エラー ({url}): {e}")
+            return None
+    
+    async def _get_cached_async(self, session: aiohttp.ClientSession, url: str) -> Tuple[bytes, str, Optional[str]]:
+        """HTTPキャッシュを使ってURLの本文を非同期で取得し、(本文, URL, Content-Type) を返す"""
+        headers = self.http_cache.conditional_headers(url) if self.http_cache else {}
+        async with session.get(url, headers=headers) as response:
+            if response.status == 304:
+                content = self.http_cache.revalidated(url)
+                if content is not None:
+                    with self._lock:
+                        self.fetch_stats['not_modified'] += 1
+                    return content, url, None
+            else:
+                response.raise_for_status()
+                content = await response.read()
+                if self.http_cache:
+                    self.http_cache.store(url, content, response.headers)
+                return content, url, response.headers.get('Content-Type')
+        # キャッシュの本文が失われていれば通常のGETで取り直す
+        async with session.get(url) as response:
+            response.raise_for_status()
+            content = await response.read()
+        if self.http_cache:
+            self.http_cache.store(url, content, response.headers)
+        return content, url, response.headers.get('Content-Type')
+
+
 class HistoryManager:
-    """投稿履歴を管理するクラス（GitHub Gist、PostgreSQL、またはJSONファイル）"""
+    """投稿履歴を管理するクラス（GitHub Gist、PostgreSQL、SQLite、またはJSONLファイル）"""
     
     def __init__(self, history_file: Path, retention_days: int = 90):
         self.history_file = history_file
+        # ファイルで管理する場合の追記型ログ（1行に1件の投稿履歴）
+        self.log_file = history_file.with_suffix('.jsonl')
         self.retention_days = retention_days
-        self.storage_type = "file"  # "gist", "database", "file"
-        self.db_conn = None
+        self.storage_type = "file"  # "gist", "database", "sqlite", "file"
+        self.db_pool = None
+        self.sqlite_conn: Optional[sqlite3.Connection] = None
+        self._sqlite_lock = threading.Lock()
+        # 接続ごとの最終使用時刻（key: 接続のid）
+        self._db_last_used: Dict[int, float] = {}
         self.gist_id = None
         self.github_token = None
+        self.history: Dict[str, str] = {}
+        # Gistに未反映の変更があるかどうか、Gistの読み込みに失敗したかどうか
+        self._dirty = False
+        self._gist_load_failed = False
         
         # GitHub Gist接続を試みる（最優先）
         github_token = os.getenv("GITHUB_TOKEN")
@@ -344,12 +1683,15 @@ class HistoryManager:
             database_url = os.getenv("DATABASE_URL")
             if database_url:
                 try:
-                    import psycopg2
+                    from psycopg2.pool import ThreadedConnectionPool
                     from urllib.parse import urlparse
                     
                     # DATABASE_URLをパース
                     parsed = urlparse(database_url)
-                    self.db_conn = psycopg2.connect(
+                    # 接続は操作ごとにプールから借り、長時間動くBotでも使い回す
+                    self.db_pool = ThreadedConnectionPool(
+                        1,
+                        DB_POOL_MAX_CONN,
                         host=parsed.hostname,
                         port=parsed.port,
                         database=parsed.path[1:],  # 先頭の/を除去
@@ -360,35 +1702,139 @@ class HistoryManager:
                     self._init_database()
                     logger.info("PostgreSQLデータベースに接続しました")
                 except Exception as e:
-                    logger.warning(f"PostgreSQL接続エラー（JSONファイルにフォールバック）: {e}")
+                    logger.warning(f"PostgreSQL接続エラー（ローカルの履歴にフォールバック）: {e}")
                     self.storage_type = "file"
         
-        if self.storage_type == "file":
-            self.history = self.load_history()
-            self.cleanup_old_history()
+        # GistもPostgreSQLも使わない場合はSQLiteを使う
+        if self.storage_type == "file" and HISTORY_BACKEND != "file":
+            self._open_sqlite()
+        
+        self.refresh()
     
-    def _init_database(self):
-        """データベーステーブルを初期化"""
-        if not self.db_conn:
-            return
+    def refresh(self):
+        """履歴のスナップショットを読み込み直し、古い履歴を削除
         
+        Gistの場合は1回の実行につき1回だけ読み込み、以降はメモリ上の履歴で判定する
+        """
+        if self.storage_type == "gist" and self._dirty:
+            # 未反映の変更を失わないよう先に書き戻す
+            self.flush()
+        if self.storage_type in ("gist", "file"):
+            self.history = self.load_history()
+        self.cleanup_old_history()
+    
+    def _open_sqlite(self):
+        """SQLiteの履歴データベースを開く（WALモード、キーと投稿日時にインデックス）"""
         try:
-            with self.db_conn.cursor() as cur:
-                cur.execute("""
+            self.sqlite_conn = sqlite3.connect(str(HISTORY_DB_FILE), check_same_thread=False)
+            with self.sqlite_conn:
+                self.sqlite_conn.execute("PRAGMA journal_mode=WAL")
+                self.sqlite_conn.execute("PRAGMA synchronous=NORMAL")
+                # article_keyは主キーなので一意インデックスで検索される
+                self.sqlite_conn.execute("""
                     CREATE TABLE IF NOT EXISTS posted_history (
-                        id SERIAL PRIMARY KEY,
-                        article_key VARCHAR(255) UNIQUE NOT NULL,
-                        posted_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+                        article_key TEXT PRIMARY KEY,
+                        posted_at TEXT NOT NULL
                     )
                 """)
-                cur.execute("""
-                    CREATE INDEX IF NOT EXISTS idx_posted_at 
+                self.sqlite_conn.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_posted_at
                     ON posted_history(posted_at)
                 """)
-                self.db_conn.commit()
+            self.storage_type = "sqlite"
+            self._migrate_file_to_sqlite()
+            logger.info(f"SQLite（{HISTORY_DB_FILE}）を使用して履歴を管理します")
+        except Exception as e:
+            logger.warning(f"SQLite接続エラー（JSONLファイルにフォールバック）: {e}")
+            if self.sqlite_conn:
+                self.sqlite_conn.close()
+                self.sqlite_conn = None
+            self.storage_type = "file"
+    
+    def _migrate_file_to_sqlite(self):
+        """空のSQLiteに、既存のファイルの履歴を取り込む"""
+        if not (self.log_file.exists() or self.history_file.exists()):
+            return
+        with self._sqlite_lock:
+            if self.sqlite_conn.execute("SELECT 1 FROM posted_history LIMIT 1").fetchone():
+                return
+        
+        history = self._load_from_file()
+        with self._sqlite_lock, self.sqlite_conn:
+            self.sqlite_conn.executemany(
+                "INSERT OR IGNORE INTO posted_history (article_key, posted_at) VALUES (?, ?)",
+                history.items()
+            )
+        if self.log_file.exists():
+            os.replace(self.log_file, self.log_file.with_suffix('.jsonl.migrated'))
+        logger.info(f"ファイルの履歴{len(history)}件をSQLiteに移行しました")
+    
+    def _run_db(self, operation: Callable[[Any], Any]) -> Any:
+        """プールから借りた接続でoperation(cursor)を実行してコミット
+        
+        しばらく使われていなかった接続は事前に生存確認し、接続エラーの場合は
+        壊れた接続を破棄してバックオフしながら新しい接続で再試行する
+        """
+        import psycopg2
+        
+        delay = DB_RETRY_BACKOFF
+        for attempt in range(1, DB_MAX_RETRIES + 1):
+            conn = None
+            try:
+                conn = self.db_pool.getconn()
+                if conn.closed:
+                    raise psycopg2.InterfaceError("connection already closed")
+                if time.monotonic() - self._db_last_used.get(id(conn), 0) > DB_VALIDATE_IDLE_SECONDS:
+                    with conn.cursor() as cur:
+                        cur.execute("SELECT 1")
+                    conn.rollback()
+                
+                with conn.cursor() as cur:
+                    result = operation(cur)
+                conn.commit()
+                self._db_last_used[id(conn)] = time.monotonic()
+                self.db_pool.putconn(conn)
+                return result
+            except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                if conn is not None:
+                    self._db_last_used.pop(id(conn), None)
+                    self.db_pool.putconn(conn, close=True)
+                if attempt == DB_MAX_RETRIES:
+                    raise
+                logger.warning(
+                    f"データベース接続エラー（{delay}秒後に再接続します {attempt}/{DB_MAX_RETRIES}）: {e}"
+                )
+                time.sleep(delay)
+                delay *= 2
+            except Exception:
+                if conn is not None:
+                    if not conn.closed:
+                        conn.rollback()
+                    self.db_pool.putconn(conn)
+                raise
+    
+    def _init_database(self):
+        """データベーステーブルを初期化"""
+        if not self.db_pool:
+            return
+        
+        def create_tables(cur):
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS posted_history (
+                    id SERIAL PRIMARY KEY,
+                    article_key VARCHAR(255) UNIQUE NOT NULL,
+                    posted_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            cur.execute("""
+                CREATE INDEX IF NOT EXISTS idx_posted_at 
+                ON posted_history(posted_at)
+            """)
+        
+        try:
+            self._run_db(create_tables)
         except Exception as e:
             logger.error(f"データベース初期化エラー: {e}")
-            self.db_conn.rollback()
     
     def load_history(self) -> Dict[str, str]:
         """投稿履歴を読み込む（key: 記事のキー, value: 投稿日時のISO形式）"""
@@ -396,6 +1842,9 @@ class HistoryManager:
             return self._load_from_gist()
         elif self.storage_type == "database":
             return self._load_from_database()
+        elif self.storage_type == "sqlite":
+            with self._sqlite_lock:
+                return dict(self.sqlite_conn.execute("SELECT article_key, posted_at FROM posted_history"))
         else:
             return self._load_from_file()
     
@@ -408,53 +1857,74 @@ class HistoryManager:
         try:
             import requests
             
-            headers = {
-                "Authorization": f"token {self.github_token}",
-                "Accept": "application/vnd.github.v3+json"
-            }
-            
             response = requests.get(
                 f"https://api.github.com/gists/{self.gist_id}",
-                headers=headers,
+                headers=self.gist_headers(self.github_token),
                 timeout=10
             )
             response.raise_for_status()
             
-            gist_data = response.json()
-            # Gistのファイル名は "posted_history.json" を想定
-            files = gist_data.get("files", {})
-            for filename, file_info in files.items():
-                if filename.endswith(".json"):
-                    content = file_info.get("content", "{}")
-                    data = json.loads(content)
-                    history = data.get("history", {})
-                    logger.info(f"GitHub Gistから{len(history)}件の履歴を読み込みました")
-                    break
+            history = self.parse_gist_history(response.json())
+            self._gist_load_failed = False
         except Exception as e:
             logger.error(f"GitHub Gist読み込みエラー: {e}")
+            self._gist_load_failed = True
         
         return history
     
     def _load_from_database(self) -> Dict[str, str]:
         """データベースから履歴を読み込む"""
         history = {}
-        if not self.db_conn:
+        if not self.db_pool:
             return history
         
+        def select_all(cur):
+            cur.execute("SELECT article_key, posted_at FROM posted_history")
+            return cur.fetchall()
+        
         try:
-            with self.db_conn.cursor() as cur:
-                cur.execute("SELECT article_key, posted_at FROM posted_history")
-                for row in cur.fetchall():
-                    article_key, posted_at = row
-                    history[article_key] = posted_at.isoformat()
+            for article_key, posted_at in self._run_db(select_all):
+                history[article_key] = posted_at.isoformat()
             logger.info(f"データベースから{len(history)}件の履歴を読み込みました")
         except Exception as e:
             logger.error(f"データベース読み込みエラー: {e}")
         
         return history
     
-    def _load_from_file(self) -> Dict[str, str]:
-        """JSONファイルから履歴を読み込む"""
+    def _load_from_file(self) -> Dict[str, str]:
+        """追記型のJSONLファイル（と旧形式のJSONファイル）から履歴を読み込む
+        
+        旧形式のJSONファイルがある場合や、重複・破損行が溜まっている場合は
+        ここでJSONLファイルを書き直す（コンパクション）
+        """
+        history = self._load_legacy_file()
+        migrated = bool(history)
+        line_count = 0
+        
+        if self.log_file.exists():
+            try:
+                with open(self.log_file, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        line_count += 1
+                        try:
+                            entry = json.loads(line)
+                            history[entry['key']] = entry['posted_at']
+                        except (ValueError, KeyError, TypeError):
+                            # 書き込み途中で中断された行などは読み飛ばす
+                            continue
+            except Exception as e:
+                logger.warning(f"履歴ファイルの読み込みエラー: {e}")
+        
+        if migrated or line_count > len(history):
+            self.history = history
+            if self._compact_file() and migrated:
+                # 移行が済んだ旧形式のファイルは残しておくが、次回以降は読まない
+                os.replace(self.history_file, self.history_file.with_suffix('.json.migrated'))
+                logger.info(f"旧形式の履歴ファイルを{self.log_file}に移行しました")
+        return history
+    
+    def _load_legacy_file(self) -> Dict[str, str]:
+        """旧形式のJSONファイルから履歴を読み込む"""
         if self.history_file.exists():
             try:
                 with open(self.history_file, 'r', encoding='utf-8') as f:
@@ -480,11 +1950,16 @@ class HistoryManager:
         """投稿履歴を保存する"""
         if self.storage_type == "gist":
             self._save_to_gist()
-        elif self.storage_type == "database":
+        elif self.storage_type in ("database", "sqlite"):
             # データベースは個別に保存するため、ここでは何もしない
             pass
         else:
-            self._save_to_file()
+            self._compact_file()
+    
+    def flush(self):
+        """メモリ上の履歴の変更をまとめて書き戻す（Gistの場合は1回のPATCH）"""
+        if self._dirty:
+            self.save_history()
     
     def _save_to_gist(self):
         """GitHub Gistに履歴を保存"""
@@ -494,51 +1969,106 @@ class HistoryManager:
         try:
             import requests
             
-            # 現在の履歴を読み込む
-            current_history = self._load_from_gist()
-            # 新しい履歴で更新
-            current_history.update(self.history)
-            
-            data = {
-                'last_updated': datetime.now().isoformat(),
-                'history': current_history,
-                'retention_days': self.retention_days
-            }
-            
-            headers = {
-                "Authorization": f"token {self.github_token}",
-                "Accept": "application/vnd.github.v3+json"
-            }
-            
-            payload = {
-                "files": {
-                    "posted_history.json": {
-                        "content": json.dumps(data, ensure_ascii=False, indent=2)
-                    }
-                }
-            }
+            # 読み込み済みのスナップショットに今回の変更を反映した履歴をそのまま書き込む
+            if self._gist_load_failed:
+                # スナップショットが読めていない場合は、既存の履歴を消さないよう読み直してマージする
+                current_history = self._load_from_gist()
+                if self._gist_load_failed:
+                    logger.error("GitHub Gistを読み込めないため履歴の保存を見送ります")
+                    return
+                current_history.update(self.history)
+                self.history = current_history
             
             response = requests.patch(
                 f"https://api.github.com/gists/{self.gist_id}",
-                headers=headers,
-                json=payload,
+                headers=self.gist_headers(self.github_token),
+                json=self.gist_payload(self.history, self.retention_days),
                 timeout=10
             )
             response.raise_for_status()
+            self._dirty = False
             logger.info("GitHub Gistに履歴を保存しました")
         except Exception as e:
             logger.error(f"GitHub Gist保存エラー: {e}")
     
-    def _save_to_file(self):
-        """JSONファイルに履歴を保存"""
-        try:
-            data = {
-                'last_updated': datetime.now().isoformat(),
-                'history': self.history,
-                'retention_days': self.retention_days
+    @staticmethod
+    def gist_headers(github_token: str) -> Dict[str, str]:
+        """GitHub API用のリクエストヘッダー"""
+        return {
+            "Authorization": f"token {github_token}",
+            "Accept": "application/vnd.github.v3+json"
+        }
+    
+    @staticmethod
+    def parse_gist_history(gist_data: Dict) -> Dict[str, str]:
+        """GitHub APIのGist情報から履歴を取り出す"""
+        history = {}
+        # Gistのファイル名は "posted_history.json" を想定（クローラーの状態のファイルは除く）
+        files = gist_data.get("files", {})
+        if "posted_history.json" in files:
+            files = {"posted_history.json": files["posted_history.json"]}
+        for filename, file_info in files.items():
+            if filename.endswith(".json") and filename != CRAWLER_STATE_GIST_FILE:
+                content = file_info.get("content", "{}")
+                data = json.loads(content)
+                history = data.get("history", {})
+                logger.info(f"GitHub Gistから{len(history)}件の履歴を読み込みました")
+                break
+        return history
+    
+    @staticmethod
+    def gist_payload(history: Dict[str, str], retention_days: int) -> Dict:
+        """Gistを更新するPATCHリクエストのボディ"""
+        data = {
+            'last_updated': datetime.now().isoformat(),
+            'history': history,
+            'retention_days': retention_days
+        }
+        return {
+            "files": {
+                "posted_history.json": {
+                    "content": json.dumps(data, ensure_ascii=False, indent=2)
+                }
             }
-            with open(self.history_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+        }
+    
+    @staticmethod
+    def expired_keys(history: Dict[str, str], cutoff_date: datetime) -> List[str]:
+        """保持期間を過ぎた（または日付が不正な）履歴のキー"""
+        keys_to_remove = []
+        for key, posted_at_str in history.items():
+            try:
+                posted_at = datetime.fromisoformat(posted_at_str)
+                if posted_at < cutoff_date:
+                    keys_to_remove.append(key)
+            except (ValueError, TypeError):
+                # 無効な日付形式の場合は削除
+                keys_to_remove.append(key)
+        return keys_to_remove
+    
+    def _compact_file(self) -> bool:
+        """現在の履歴だけを含むJSONLファイルを一時ファイルに書き、アトミックに置き換える"""
+        try:
+            tmp_file = self.log_file.with_suffix('.jsonl.tmp')
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                for key, posted_at in self.history.items():
+                    f.write(json.dumps({'key': key, 'posted_at': posted_at}, ensure_ascii=False) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.log_file)
+            return True
+        except Exception as e:
+            logger.error(f"履歴ファイルの保存エラー: {e}")
+            return False
+    
+    def _append_to_file(self, keys: List[str], posted_at: str):
+        """投稿済みの記事をJSONLファイルに1行ずつ追記"""
+        try:
+            with open(self.log_file, 'a', encoding='utf-8') as f:
+                for key in keys:
+                    f.write(json.dumps({'key': key, 'posted_at': posted_at}, ensure_ascii=False) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
         except Exception as e:
             logger.error(f"履歴ファイルの保存エラー: {e}")
     
@@ -550,69 +2080,59 @@ class HistoryManager:
             self._cleanup_gist(cutoff_date)
         elif self.storage_type == "database":
             self._cleanup_database(cutoff_date)
+        elif self.storage_type == "sqlite":
+            self._cleanup_sqlite(cutoff_date)
         else:
             self._cleanup_file(cutoff_date)
     
     def _cleanup_gist(self, cutoff_date: datetime):
-        """GitHub Gistから古い履歴を削除"""
-        if not self.github_token or not self.gist_id:
-            return
+        """Gistの履歴スナップショットから古い履歴を削除（書き戻しはflushでまとめて行う）"""
+        keys_to_remove = self.expired_keys(self.history, cutoff_date)
         
-        try:
-            history = self._load_from_gist()
-            initial_count = len(history)
-            
-            keys_to_remove = []
-            for key, posted_at_str in history.items():
-                try:
-                    posted_at = datetime.fromisoformat(posted_at_str)
-                    if posted_at < cutoff_date:
-                        keys_to_remove.append(key)
-                except (ValueError, TypeError):
-                    keys_to_remove.append(key)
-            
-            for key in keys_to_remove:
-                del history[key]
-            
-            if keys_to_remove:
-                self.history = history
-                self._save_to_gist()
-                logger.info(f"GitHub Gistから古い投稿履歴を{len(keys_to_remove)}件削除しました")
-        except Exception as e:
-            logger.error(f"GitHub Gistクリーンアップエラー: {e}")
+        for key in keys_to_remove:
+            del self.history[key]
+        
+        if keys_to_remove:
+            self._dirty = True
+            logger.info(f"GitHub Gistの古い投稿履歴を{len(keys_to_remove)}件削除します")
     
     def _cleanup_database(self, cutoff_date: datetime):
         """データベースから古い履歴を削除"""
-        if not self.db_conn:
+        if not self.db_pool:
             return
         
+        def delete_old(cur):
+            cur.execute(
+                "DELETE FROM posted_history WHERE posted_at < %s",
+                (cutoff_date,)
+            )
+            return cur.rowcount
+        
         try:
-            with self.db_conn.cursor() as cur:
-                cur.execute(
-                    "DELETE FROM posted_history WHERE posted_at < %s",
-                    (cutoff_date,)
-                )
-                deleted_count = cur.rowcount
-                self.db_conn.commit()
-                if deleted_count > 0:
-                    logger.info(f"データベースから古い投稿履歴を{deleted_count}件削除しました")
+            deleted_count = self._run_db(delete_old)
+            if deleted_count > 0:
+                logger.info(f"データベースから古い投稿履歴を{deleted_count}件削除しました")
         except Exception as e:
             logger.error(f"データベースクリーンアップエラー: {e}")
-            self.db_conn.rollback()
+    
+    def _cleanup_sqlite(self, cutoff_date: datetime):
+        """SQLiteから古い履歴を削除（posted_atのインデックスで範囲削除）"""
+        try:
+            with self._sqlite_lock, self.sqlite_conn:
+                cur = self.sqlite_conn.execute(
+                    "DELETE FROM posted_history WHERE posted_at < ?",
+                    (cutoff_date.isoformat(),)
+                )
+            if cur.rowcount > 0:
+                logger.info(f"SQLiteから古い投稿履歴を{cur.rowcount}件削除しました")
+        except Exception as e:
+            logger.error(f"SQLiteクリーンアップエラー: {e}")
     
     def _cleanup_file(self, cutoff_date: datetime):
-        """JSONファイルから古い履歴を削除"""
+        """ファイルの履歴から古い履歴を削除（削除があればコンパクション）"""
         initial_count = len(self.history)
         
-        keys_to_remove = []
-        for key, posted_at_str in self.history.items():
-            try:
-                posted_at = datetime.fromisoformat(posted_at_str)
-                if posted_at < cutoff_date:
-                    keys_to_remove.append(key)
-            except (ValueError, TypeError):
-                # 無効な日付形式の場合は削除
-                keys_to_remove.append(key)
+        keys_to_remove = self.expired_keys(self.history, cutoff_date)
         
         for key in keys_to_remove:
             del self.history[key]
@@ -621,82 +2141,717 @@ class HistoryManager:
             logger.info(f"古い投稿履歴を{len(keys_to_remove)}件削除しました（{initial_count}件 → {len(self.history)}件）")
             self.save_history()
     
-    def is_posted(self, news_item: Dict) -> bool:
+    @staticmethod
+    def article_key(news_item) -> str:
+        """投稿履歴のキー（日付とタイトルの組み合わせ）。NewsItemのほか、同じキーを持つ辞書も受け付ける"""
+        if isinstance(news_item, NewsItem):
+            return news_item.history_key
+        return f"{news_item.get('date')}_{news_item.get('title')}"
+    
+    def is_posted(self, news_item: NewsItem) -> bool:
         """既に投稿済みかどうかをチェック"""
-        key = f"{news_item.get('date')}_{news_item.get('title')}"
+        return self.is_posted_many([news_item])[0]
+    
+    def is_posted_many(self, news_items: List[NewsItem]) -> List[bool]:
+        """複数の記事が投稿済みかどうかをまとめてチェック（データベースは1回の問い合わせ）"""
+        keys = [self.article_key(item) for item in news_items]
+        if not keys:
+            return []
         
-        if self.storage_type == "gist":
-            history = self._load_from_gist()
-            return key in history
-        elif self.storage_type == "database":
-            return self._is_posted_in_database(key)
+        if self.storage_type == "database":
+            posted_keys = self._posted_keys_in_database(keys)
+        elif self.storage_type == "sqlite":
+            posted_keys = self._posted_keys_in_sqlite(keys)
         else:
-            return key in self.history
+            posted_keys = self.history
+        return [key in posted_keys for key in keys]
     
-    def _is_posted_in_database(self, key: str) -> bool:
-        """データベースで投稿済みかチェック"""
-        if not self.db_conn:
-            return False
+    def _posted_keys_in_database(self, keys: List[str]) -> Set[str]:
+        """データベースに存在するキーを1回のクエリで取得
+        
+        再接続しても確認できない場合は、重複投稿を避けるため例外をそのまま送出する
+        """
+        if not self.db_pool:
+            return set()
+        
+        def select_posted(cur):
+            cur.execute(
+                "SELECT article_key FROM posted_history WHERE article_key = ANY(%s)",
+                (keys,)
+            )
+            return {row[0] for row in cur.fetchall()}
         
         try:
-            with self.db_conn.cursor() as cur:
-                cur.execute("SELECT 1 FROM posted_history WHERE article_key = %s", (key,))
-                return cur.fetchone() is not None
+            return self._run_db(select_posted)
         except Exception as e:
             logger.error(f"データベースチェックエラー: {e}")
-            return False
+            raise
+    
+    def _posted_keys_in_sqlite(self, keys: List[str]) -> Set[str]:
+        """SQLiteに存在するキーを取得（変数の上限を超えないよう分割して問い合わせ）"""
+        posted_keys = set()
+        with self._sqlite_lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self.sqlite_conn.execute(
+                    f"SELECT article_key FROM posted_history WHERE article_key IN ({placeholders})",
+                    chunk
+                )
+                posted_keys.update(row[0] for row in rows)
+        return posted_keys
     
-    def mark_as_posted(self, news_item: Dict):
+    def mark_as_posted(self, news_item: NewsItem):
         """投稿済みとしてマーク"""
-        key = f"{news_item.get('date')}_{news_item.get('title')}"
+        self.mark_as_posted_many([news_item])
+    
+    def mark_as_posted_many(self, news_items: List[NewsItem]):
+        """複数の記事をまとめて投稿済みとしてマーク"""
+        keys = [self.article_key(item) for item in news_items]
+        if not keys:
+            return
         
+        posted_at = datetime.now()
         if self.storage_type == "gist":
-            # Gistの場合は履歴を読み込んでから更新
-            history = self._load_from_gist()
-            history[key] = datetime.now().isoformat()
-            self.history = history
-            self._save_to_gist()
+            # Gistの場合はメモリ上で更新し、flushでまとめて書き戻す
+            for key in keys:
+                self.history[key] = posted_at.isoformat()
+            self._dirty = True
         elif self.storage_type == "database":
-            self._mark_as_posted_in_database(key)
+            self._mark_as_posted_in_database(keys, posted_at)
+        elif self.storage_type == "sqlite":
+            try:
+                with self._sqlite_lock, self.sqlite_conn:
+                    self.sqlite_conn.executemany(
+                        "INSERT OR IGNORE INTO posted_history (article_key, posted_at) VALUES (?, ?)",
+                        [(key, posted_at.isoformat()) for key in keys]
+                    )
+            except Exception as e:
+                logger.error(f"SQLite保存エラー: {e}")
         else:
-            self.history[key] = datetime.now().isoformat()
-            self.save_history()
+            # ファイル全体は書き直さず、追記だけ行う
+            for key in keys:
+                self.history[key] = posted_at.isoformat()
+            self._append_to_file(keys, posted_at.isoformat())
     
-    def _mark_as_posted_in_database(self, key: str):
-        """データベースに投稿済みとしてマーク"""
-        if not self.db_conn:
+    def _mark_as_posted_in_database(self, keys: List[str], posted_at: datetime):
+        """データベースに複数行を1回のUPSERTで投稿済みとしてマーク"""
+        if not self.db_pool:
             return
         
+        from psycopg2.extras import execute_values
+        
+        def upsert(cur):
+            execute_values(cur, """
+                INSERT INTO posted_history (article_key, posted_at)
+                VALUES %s
+                ON CONFLICT (article_key) DO NOTHING
+            """, [(key, posted_at) for key in keys])
+        
         try:
-            with self.db_conn.cursor() as cur:
-                cur.execute("""
-                    INSERT INTO posted_history (article_key, posted_at)
-                    VALUES (%s, %s)
-                    ON CONFLICT (article_key) DO NOTHING
-                """, (key, datetime.now()))
-                self.db_conn.commit()
+            self._run_db(upsert)
         except Exception as e:
             logger.error(f"データベース保存エラー: {e}")
-            self.db_conn.rollback()
+    
+    def close(self):
+        """データベースの接続プールを閉じる"""
+        if self.db_pool:
+            try:
+                self.db_pool.closeall()
+            except Exception:
+                pass
+            self.db_pool = None
+        if self.sqlite_conn:
+            with self._sqlite_lock:
+                self.sqlite_conn.close()
+            self.sqlite_conn = None
     
     def __del__(self):
         """データベース接続を閉じる"""
-        if self.db_conn:
+        self.close()
+
+
+class AsyncHistoryManager:
+    """投稿履歴を管理する非同期クラス
+    
+    GitHub Gistはaiohttp、PostgreSQLはasyncpg（インストールされている場合）で
+    イベントループ上から直接読み書きする。それ以外のバックエンドは
+    HistoryManagerをワーカースレッドで動かし、イベントループを止めない。
+    """
+    
+    def __init__(self, history_file: Path, retention_days: int = 90):
+        self.history_file = history_file
+        self.retention_days = retention_days
+        self.github_token = os.getenv("GITHUB_TOKEN")
+        self.gist_id = os.getenv("GIST_ID")
+        self.database_url = os.getenv("DATABASE_URL")
+        self.history: Dict[str, str] = {}
+        self._dirty = False
+        self._gist_load_failed = False
+        self._http: Optional[aiohttp.ClientSession] = None
+        self._pg_pool = None
+        # ワーカースレッドで動かす同期版の履歴管理（"thread"の場合）
+        self._sync: Optional[HistoryManager] = None
+        self._opened = False
+        
+        if self.github_token and self.gist_id:
+            self.storage_type = "gist"
+        elif self.database_url and importlib.util.find_spec("asyncpg"):
+            self.storage_type = "database"
+        else:
+            self.storage_type = "thread"
+    
+    async def _open(self):
+        """バックエンドに接続（最初のrefreshで1回だけ呼ばれる）"""
+        self._opened = True
+        if self.storage_type == "database":
+            try:
+                import asyncpg
+                
+                self._pg_pool = await asyncpg.create_pool(
+                    dsn=self.database_url,
+                    min_size=1,
+                    max_size=DB_POOL_MAX_CONN
+                )
+                await self._run_db(lambda conn: conn.execute("""
+                    CREATE TABLE IF NOT EXISTS posted_history (
+                        id SERIAL PRIMARY KEY,
+                        article_key VARCHAR(255) UNIQUE NOT NULL,
+                        posted_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+                    );
+                    CREATE INDEX IF NOT EXISTS idx_posted_at ON posted_history(posted_at);
+                """))
+                logger.info("PostgreSQLデータベースに接続しました（asyncpg）")
+                return
+            except Exception as e:
+                logger.warning(f"asyncpgでの接続エラー（同期版の履歴管理にフォールバック）: {e}")
+                self.storage_type = "thread"
+        
+        if self.storage_type == "thread":
+            # 同期版はコンストラクタで読み込みと古い履歴の削除まで行う
+            self._sync = await asyncio.to_thread(HistoryManager, self.history_file, self.retention_days)
+    
+    async def refresh(self):
+        """履歴のスナップショットを読み込み直し、古い履歴を削除"""
+        if not self._opened:
+            await self._open()
+            if self.storage_type == "thread":
+                return
+        
+        cutoff_date = datetime.now() - timedelta(days=self.retention_days)
+        if self.storage_type == "gist":
+            if self._dirty:
+                await self.flush()
+            self.history = await self._load_from_gist()
+            keys_to_remove = HistoryManager.expired_keys(self.history, cutoff_date)
+            for key in keys_to_remove:
+                del self.history[key]
+            if keys_to_remove:
+                self._dirty = True
+                logger.info(f"GitHub Gistの古い投稿履歴を{len(keys_to_remove)}件削除します")
+        elif self.storage_type == "database":
+            try:
+                status = await self._run_db(
+                    lambda conn: conn.execute("DELETE FROM posted_history WHERE posted_at < $1", cutoff_date)
+                )
+                deleted_count = int(status.split()[-1])
+                if deleted_count > 0:
+                    logger.info(f"データベースから古い投稿履歴を{deleted_count}件削除しました")
+            except Exception as e:
+                logger.error(f"データベースクリーンアップエラー: {e}")
+        else:
+            await asyncio.to_thread(self._sync.refresh)
+    
+    async def is_posted_many(self, news_items: List[NewsItem]) -> List[bool]:
+        """複数の記事が投稿済みかどうかをまとめてチェック"""
+        if not self._opened:
+            await self.refresh()
+        if self.storage_type == "thread":
+            return await asyncio.to_thread(self._sync.is_posted_many, news_items)
+        
+        keys = [HistoryManager.article_key(item) for item in news_items]
+        if not keys:
+            return []
+        if self.storage_type == "gist":
+            posted_keys = self.history
+        else:
+            try:
+                rows = await self._run_db(lambda conn: conn.fetch(
+                    "SELECT article_key FROM posted_history WHERE article_key = ANY($1::text[])", keys
+                ))
+            except Exception as e:
+                # 確認できないまま投稿すると重複するため例外をそのまま送出する
+                logger.error(f"データベースチェックエラー: {e}")
+                raise
+            posted_keys = {row['article_key'] for row in rows}
+        return [key in posted_keys for key in keys]
+    
+    async def is_posted(self, news_item: NewsItem) -> bool:
+        """既に投稿済みかどうかをチェック"""
+        return (await self.is_posted_many([news_item]))[0]
+    
+    async def mark_as_posted_many(self, news_items: List[NewsItem]):
+        """複数の記事をまとめて投稿済みとしてマーク"""
+        if not news_items:
+            return
+        if not self._opened:
+            await self.refresh()
+        if self.storage_type == "thread":
+            await asyncio.to_thread(self._sync.mark_as_posted_many, news_items)
+            return
+        
+        keys = [HistoryManager.article_key(item) for item in news_items]
+        posted_at = datetime.now()
+        if self.storage_type == "gist":
+            # メモリ上で更新し、flushでまとめて書き戻す
+            for key in keys:
+                self.history[key] = posted_at.isoformat()
+            self._dirty = True
+        else:
+            try:
+                await self._run_db(lambda conn: conn.execute("""
+                    INSERT INTO posted_history (article_key, posted_at)
+                    SELECT unnest($1::text[]), $2
+                    ON CONFLICT (article_key) DO NOTHING
+                """, keys, posted_at))
+            except Exception as e:
+                logger.error(f"データベース保存エラー: {e}")
+    
+    async def mark_as_posted(self, news_item: NewsItem):
+        """投稿済みとしてマーク"""
+        await self.mark_as_posted_many([news_item])
+    
+    async def flush(self):
+        """メモリ上の履歴の変更をまとめて書き戻す"""
+        if self.storage_type == "thread":
+            if self._sync:
+                await asyncio.to_thread(self._sync.flush)
+        elif self.storage_type == "gist" and self._dirty:
+            await self._save_to_gist()
+    
+    async def close(self):
+        """接続を閉じる"""
+        if self._http:
+            await self._http.close()
+            self._http = None
+        if self._pg_pool:
+            await self._pg_pool.close()
+            self._pg_pool = None
+        if self._sync:
+            await asyncio.to_thread(self._sync.close)
+    
+    async def _run_db(self, operation: Callable[[Any], Any]) -> Any:
+        """プールから借りた接続でoperation(conn)を実行（接続エラー時はバックオフして再試行）"""
+        import asyncpg
+        
+        delay = DB_RETRY_BACKOFF
+        for attempt in range(1, DB_MAX_RETRIES + 1):
+            try:
+                async with self._pg_pool.acquire() as conn:
+                    return await operation(conn)
+            except (asyncpg.PostgresConnectionError, asyncpg.InterfaceError, OSError) as e:
+                if attempt == DB_MAX_RETRIES:
+                    raise
+                logger.warning(
+                    f"データベース接続エラー（{delay}秒後に再接続します {attempt}/{DB_MAX_RETRIES}）: {e}"
+                )
+                await asyncio.sleep(delay)
+                delay *= 2
+    
+    def _http_session(self) -> aiohttp.ClientSession:
+        if self._http is None or self._http.closed:
+            self._http = aiohttp.ClientSession(
+                headers=HistoryManager.gist_headers(self.github_token),
+                timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+            )
+        return self._http
+    
+    async def _load_from_gist(self) -> Dict[str, str]:
+        """GitHub Gistから履歴を非同期で読み込む"""
+        try:
+            async with self._http_session().get(f"https://api.github.com/gists/{self.gist_id}") as response:
+                response.raise_for_status()
+                gist_data = await response.json()
+            self._gist_load_failed = False
+            return HistoryManager.parse_gist_history(gist_data)
+        except Exception as e:
+            logger.error(f"GitHub Gist読み込みエラー: {e}")
+            self._gist_load_failed = True
+            return {}
+    
+    async def _save_to_gist(self):
+        """GitHub Gistに履歴を1回のPATCHで非同期に保存"""
+        if self._gist_load_failed:
+            # スナップショットが読めていない場合は、既存の履歴を消さないよう読み直してマージする
+            current_history = await self._load_from_gist()
+            if self._gist_load_failed:
+                logger.error("GitHub Gistを読み込めないため履歴の保存を見送ります")
+                return
+            current_history.update(self.history)
+            self.history = current_history
+        
+        try:
+            async with self._http_session().patch(
+                f"https://api.github.com/gists/{self.gist_id}",
+                json=HistoryManager.gist_payload(self.history, self.retention_days)
+            ) as response:
+                response.raise_for_status()
+            self._dirty = False
+            logger.info("GitHub Gistに履歴を保存しました")
+        except Exception as e:
+            logger.error(f"GitHub Gist保存エラー: {e}")
+
+
+def build_store_embed(store_info: NewsItem) -> discord.Embed:
+    """都内の新店情報を投稿するEmbedを作成"""
+    embed = discord.Embed(
+        title="東京に天下一品がオープンするよ！",
+        description=store_info.title,
+        url=store_info.url,
+        color=discord.Color.orange(),
+        timestamp=datetime.now()
+    )
+    embed.add_field(name="記事日付", value=store_info.date, inline=True)
+    
+    # 区市町村が分かる場合は表示
+    ward = store_info.ward
+    if ward:
+        embed.add_field(name="エリア", value=f"東京都{ward}", inline=True)
+    
+    # オープン日がある場合は表示
+    opening_date = store_info.opening_date
+    if opening_date:
+        embed.add_field(name="オープン日", value=opening_date, inline=True)
+    
+    embed.add_field(name="詳細", value=f"[記事を読む]({store_info.url})", inline=True)
+    return embed
+
+
+def build_digest_messages(stores: List[NewsItem]) -> List[Tuple[List[NewsItem], List[discord.Embed]]]:
+    """都内の新店情報を1つのまとめEmbedにする（説明文の上限を超える場合は複数のメッセージに分ける）"""
+    chunks: List[List[Tuple[NewsItem, str]]] = [[]]
+    length = 0
+    for store_info in stores:
+        details = [f"記事日付: {store_info.date}"]
+        if store_info.ward:
+            details.append(f"エリア: 東京都{store_info.ward}")
+        if store_info.opening_date:
+            details.append(f"オープン日: {store_info.opening_date}")
+        line = f"・[{store_info.title}]({store_info.url})\n　{' / '.join(details)}"[:DISCORD_EMBED_DESCRIPTION_LIMIT]
+        if chunks[-1] and length + len(line) + 1 > DISCORD_EMBED_DESCRIPTION_LIMIT:
+            chunks.append([])
+            length = 0
+        chunks[-1].append((store_info, line))
+        length += len(line) + 1
+    
+    chunks = [chunk for chunk in chunks if chunk]
+    messages = []
+    for i, chunk in enumerate(chunks, 1):
+        # 分割した場合は各メッセージの件数と通し番号を示す
+        part = f" {i}/{len(chunks)}" if len(chunks) > 1 else ""
+        embed = discord.Embed(
+            title=f"東京に天下一品がオープンするよ！（{len(chunk)}件{part}）",
+            description='\n'.join(line for _, line in chunk),
+            color=discord.Color.orange(),
+            timestamp=datetime.now()
+        )
+        messages.append(([store_info for store_info, _ in chunk], [embed]))
+    return messages
+
+
+def build_store_messages(stores: List[NewsItem], post_format: str = POST_FORMAT) -> List[Tuple[List[NewsItem], List[discord.Embed]]]:
+    """投稿形式に応じて、(メッセージに含む記事, Embedのリスト) をメッセージごとに作成"""
+    if post_format == 'digest':
+        return build_digest_messages(stores)
+    size = DISCORD_MAX_EMBEDS_PER_MESSAGE if post_format == 'batch' else 1
+    messages = []
+    for i in range(0, len(stores), size):
+        batch = stores[i:i + size]
+        messages.append((batch, [build_store_embed(store_info) for store_info in batch]))
+    return messages
+
+
+async def send_store_posts(send: Callable[[List[discord.Embed]], Awaitable[Any]], history_manager,
+                           stores: List[NewsItem], post_format: str = POST_FORMAT) -> List[NewsItem]:
+    """都内の新店情報を投稿し、送信できたメッセージごとにまとめて投稿済みにする
+    
+    APIの呼び出し回数は記事数ではなくメッセージ数になる。送信できた記事のリストを返す
+    """
+    posted_stores = []
+    async with DiscordSendQueue(send) as queue:
+        sends = [(batch, queue.put(embeds)) for batch, embeds in build_store_messages(stores, post_format)]
+        for batch, sent in sends:
+            await sent
+            await history_manager.mark_as_posted_many(batch)
+            posted_stores.extend(batch)
+            for store_info in batch:
+                logger.info(f"投稿しました: {store_info.title}")
+    return posted_stores
+
+
+class DiscordRestPoster:
+    """Gateway（WebSocket）に接続せず、HTTPだけでEmbedを投稿する
+    
+    webhook_urlがあればチャンネルのWebhookに、なければBotトークンでREST APIに送信する。
+    送信には1つのHTTPセッション（接続プール）を使い回す
+    """
+    
+    def __init__(self, token: Optional[str] = None, channel_id: int = 0, webhook_url: str = ""):
+        if webhook_url:
+            self.url = webhook_url
+            self.params = {'wait': 'true'}
+            self.headers = {}
+        elif token and channel_id:
+            self.url = f"{DISCORD_API_BASE}/channels/{channel_id}/messages"
+            self.params = {}
+            self.headers = {'Authorization': f"Bot {token}"}
+        else:
+            raise ValueError("DISCORD_WEBHOOK_URL、またはDISCORD_TOKENとDISCORD_CHANNEL_IDが必要です")
+        self._session: Optional[aiohttp.ClientSession] = None
+        # 投稿先のルートのレート制限バケット（残り回数とリセット時刻）と、全体のレート制限の解除時刻
+        self._remaining: Optional[int] = None
+        self._reset_at = 0.0
+        self._global_reset_at = 0.0
+        self.rate_limit_stats = {'limited': 0, 'wait_seconds': 0.0}
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        await self.close()
+    
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT),
+                headers=self.headers
+            )
+        return self._session
+    
+    async def send(self, embeds: List[discord.Embed]) -> Dict:
+        """Embed（最大10件）を1つのメッセージとして投稿し、作成されたメッセージを返す
+        
+        バケットに残りがあれば待たずに送信し、使い切っている場合やHTTP 429を受けた場合は
+        レスポンスヘッダー・本文で指定された時間だけ待ってから送信する
+        """
+        payload = {'embeds': [embed.to_dict() for embed in embeds]}
+        for attempt in range(1, DISCORD_MAX_RETRIES + 1):
+            await self._wait_for_bucket()
+            async with self._get_session().post(self.url, params=self.params, json=payload) as response:
+                self._update_bucket(response.headers)
+                if response.status == 429:
+                    retry_after, is_global = await self._retry_after(response)
+                    self.rate_limit_stats['limited'] += 1
+                    logger.warning(
+                        f"Discordのレート制限を受けました（{'全体' if is_global else 'ルート'}）: "
+                        f"{retry_after:.2f}秒後に再送します（{attempt}/{DISCORD_MAX_RETRIES}）"
+                    )
+                    reset_at = asyncio.get_running_loop().time() + retry_after
+                    if is_global:
+                        self._global_reset_at = reset_at
+                    else:
+                        self._remaining, self._reset_at = 0, reset_at
+                    continue
+                if response.status >= 400:
+                    raise RuntimeError(f"Discordへの投稿に失敗しました（HTTP {response.status}）: {await response.text()}")
+                return await response.json()
+        raise RuntimeError(f"Discordのレート制限により{DISCORD_MAX_RETRIES}回送信できませんでした")
+    
+    async def _wait_for_bucket(self):
+        """バケットを使い切っているか全体のレート制限中なら、解除されるまで待つ"""
+        now = asyncio.get_running_loop().time()
+        wait = self._global_reset_at - now
+        if self._remaining == 0:
+            wait = max(wait, self._reset_at - now)
+        if wait > 0:
+            self.rate_limit_stats['wait_seconds'] += wait
+            await asyncio.sleep(wait)
+    
+    def _update_bucket(self, headers):
+        """X-RateLimit-* ヘッダーからバケットの残り回数とリセット時刻を更新"""
+        remaining = headers.get('X-RateLimit-Remaining')
+        reset_after = headers.get('X-RateLimit-Reset-After')
+        if remaining is None or reset_after is None:
+            return
+        try:
+            self._remaining = int(remaining)
+            self._reset_at = asyncio.get_running_loop().time() + float(reset_after)
+        except ValueError:
+            pass
+    
+    @staticmethod
+    async def _retry_after(response: aiohttp.ClientResponse) -> Tuple[float, bool]:
+        """HTTP 429の再送までの秒数と、全体のレート制限かどうか"""
+        is_global = response.headers.get('X-RateLimit-Global', '').lower() == 'true'
+        retry_after = None
+        try:
+            data = await response.json(content_type=None)
+            retry_after = float(data.get('retry_after'))
+            is_global = is_global or bool(data.get('global'))
+        except Exception:
+            pass
+        if retry_after is None:
+            try:
+                retry_after = float(response.headers.get('Retry-After', '1'))
+            except ValueError:
+                retry_after = 1.0
+        return retry_after, is_global
+    
+    async def close(self):
+        """HTTPセッションを閉じる"""
+        if self._session:
+            await self._session.close()
+            self._session = None
+        stats = self.rate_limit_stats
+        if stats['limited'] or stats['wait_seconds']:
+            logger.info(f"Discordのレート制限: 429応答{stats['limited']}回 / 待機合計{stats['wait_seconds']:.2f}秒")
+
+
+class DiscordSendQueue:
+    """Discordへの送信キュー
+    
+    メッセージ（Embedのリスト）を登録順に1件ずつ送信する。送信間隔は固定せず、レート制限に従う送信関数
+    （discord.pyのchannel.send、DiscordRestPoster.send）に任せて、許される限り続けて送る。
+    送信に失敗したら、順序が入れ替わらないよう残りの送信を取り消す
+    """
+    
+    def __init__(self, send: Callable[[List[discord.Embed]], Awaitable[Any]]):
+        self._send = send
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._worker: Optional[asyncio.Task] = None
+        self.stats = {'sent': 0, 'failed': 0, 'cancelled': 0, 'max_depth': 0, 'latency_total': 0.0, 'latency_max': 0.0}
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        await self.close()
+    
+    @property
+    def depth(self) -> int:
+        """送信待ちの件数"""
+        return self._queue.qsize()
+    
+    def put(self, embeds: List[discord.Embed]) -> asyncio.Future:
+        """メッセージを送信待ちに追加し、送信結果を返すFutureを返す"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.put_nowait((embeds, future))
+        self.stats['max_depth'] = max(self.stats['max_depth'], self.depth)
+        if self._worker is None:
+            self._worker = loop.create_task(self._run())
+        return future
+    
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            embeds, future = await self._queue.get()
+            if future.cancelled():
+                continue
+            started = loop.time()
+            try:
+                result = await self._send(embeds)
+            except Exception as e:
+                self.stats['failed'] += 1
+                future.set_exception(e)
+                self._cancel_pending()
+                continue
+            latency = loop.time() - started
+            self.stats['sent'] += 1
+            self.stats['latency_total'] += latency
+            self.stats['latency_max'] = max(self.stats['latency_max'], latency)
+            if not future.cancelled():
+                future.set_result(result)
+    
+    def _cancel_pending(self):
+        """送信待ちをすべて取り消す"""
+        while not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if future.cancel():
+                self.stats['cancelled'] += 1
+    
+    async def close(self):
+        """送信待ちを取り消して送信を終了し、統計をログに出力"""
+        self._cancel_pending()
+        if self._worker is not None:
+            self._worker.cancel()
             try:
-                self.db_conn.close()
-            except:
+                await self._worker
+            except asyncio.CancelledError:
                 pass
+            self._worker = None
+        stats = self.stats
+        if stats['sent'] or stats['failed']:
+            average = stats['latency_total'] / stats['sent'] if stats['sent'] else 0.0
+            logger.info(
+                f"Discord送信: 送信{stats['sent']}件 / 失敗{stats['failed']}件 / 取消{stats['cancelled']}件 / "
+                f"最大待ち行列{stats['max_depth']}件 / 平均送信時間{average * 1000:.0f}ms（最大{stats['latency_max'] * 1000:.0f}ms）"
+            )
+
+
+class LoopLagMonitor:
+    """イベントループの停止（同期処理によるブロック）を検出してログに出力する
+    
+    一定間隔でスリープし、予定より起床が遅れた時間をループの遅延とみなす
+    """
+    
+    def __init__(self, threshold: float = LOOP_LAG_THRESHOLD, interval: float = LOOP_LAG_CHECK_INTERVAL):
+        self.threshold = threshold
+        self.interval = interval
+        self.max_lag = 0.0
+        self.stall_count = 0
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self):
+        """実行中のイベントループで計測を開始"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+    
+    def stop(self):
+        """計測を停止"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+    
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = loop.time() - expected
+            self.max_lag = max(self.max_lag, lag)
+            if lag >= self.threshold:
+                self.stall_count += 1
+                logger.warning(f"イベントループが{lag:.2f}秒停止しました（しきい値: {self.threshold}秒）")
 
 
 class DiscordBot(discord.Client):
-    """Discord Bot"""
+    """Discord Bot
+    
+    ニュース一覧・詳細ページの取得と判定は同期処理を含むため、専用のワーカースレッドで実行し、
+    イベントループ（Gatewayのハートビート）を止めないようにする。
+    クローラーはこのワーカースレッドからのみ操作する。
+    """
     
     def __init__(self, channel_id: int):
         intents = discord.Intents.default()
         super().__init__(intents=intents)
         self.channel_id = channel_id
-        self.crawler = TenkaippinCrawler()
-        self.history_manager = HistoryManager(HISTORY_FILE, HISTORY_RETENTION_DAYS)
+        self.crawler = AsyncTenkaippinCrawler()
+        self.history_manager = AsyncHistoryManager(HISTORY_FILE, HISTORY_RETENTION_DAYS)
+        self._crawl_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='crawler')
+        self.loop_lag_monitor = LoopLagMonitor()
+    
+    async def setup_hook(self):
+        """ログイン後、Gatewayへの接続前にループの遅延計測を開始"""
+        self.loop_lag_monitor.start()
+    
+    async def close(self):
+        """終了時に遅延計測・履歴の接続・ワーカースレッドを停止"""
+        self.loop_lag_monitor.stop()
+        await super().close()
+        await self.history_manager.close()
+        self._crawl_executor.shutdown(wait=False, cancel_futures=True)
     
     async def on_ready(self):
         """Botが起動したときの処理"""
@@ -716,51 +2871,57 @@ class DiscordBot(discord.Client):
         # 起動時にも一度実行
         await self.crawl_and_post()
     
-    def filter_recent_news(self, news_items: List[Dict], days: int) -> List[Dict]:
-        """指定日数以内の記事のみをフィルタリング"""
-        cutoff_date = datetime.now() - timedelta(days=days)
-        filtered_items = []
+    async def _run_in_crawler(self, func: Callable, *args):
+        """クローラーのワーカースレッドで関数を実行し、結果をイベントループで受け取る"""
+        return await asyncio.get_running_loop().run_in_executor(self._crawl_executor, func, *args)
+    
+    def _crawl_candidates(self) -> Optional[List[NewsItem]]:
+        """ニュース一覧を取得し、都内の新店情報の候補を返す（ワーカースレッドで実行）
         
-        for item in news_items:
-            date_str = item.get('date', '')
-            try:
-                # 日付文字列をパース（YYYY-MM-DD形式を想定）
-                item_date = datetime.strptime(date_str, '%Y-%m-%d')
-                if item_date >= cutoff_date:
-                    filtered_items.append(item)
-            except (ValueError, TypeError) as e:
-                logger.warning(f"日付のパースエラー: {date_str} - {e}")
-                # 日付がパースできない場合は含めない（安全のため）
-                continue
+        ニュース一覧に変更がなければNoneを返す
+        """
+        self.crawler.start_run()
+        
+        # ニュース一覧が前回から変わっていなければ解析せずに終了
+        if not self.crawler.check_index_changed():
+            return None
+        
+        # 直近N日以内で、前回処理した記事より新しい記事のみを処理
+        recent_news = list(self.crawler.iter_new_news(DAYS_TO_CHECK))
+        if not recent_news:
+            logger.info(f"直近{DAYS_TO_CHECK}日以内の新しい記事が見つかりませんでした")
+            return []
+        
+        # 判定に必要な詳細ページをまとめて並行取得（このスレッド専用のイベントループで実行）
+        asyncio.run(self.crawler.prefetch_details(recent_news))
         
-        logger.info(f"日付フィルタリング: {len(news_items)}件 → {len(filtered_items)}件（直近{days}日以内）")
-        return filtered_items
+        # 都内の新店情報をフィルタリング
+        return [item for item in recent_news if self.crawler.is_tokyo_store(item)]
     
     async def crawl_and_post(self):
         """ニュースをクロールして都内の新店情報を投稿"""
         try:
             logger.info("ニュースのクロールを開始します...")
-            news_items = self.crawler.fetch_news()
+            candidates = await self._run_in_crawler(self._crawl_candidates)
             
-            if not news_items:
-                logger.warning("ニュース記事が取得できませんでした")
+            if candidates is None:
+                logger.info("ニュース一覧に変更がないため処理をスキップします")
                 return
-            
-            # 直近N日以内の記事のみを処理
-            recent_news = self.filter_recent_news(news_items, DAYS_TO_CHECK)
-            
-            if not recent_news:
-                logger.info(f"直近{DAYS_TO_CHECK}日以内の記事が見つかりませんでした")
+            if not candidates:
+                logger.info("都内の新店情報は見つかりませんでした")
+                await self._run_in_crawler(self.crawler.commit_progress)
                 return
             
-            # 都内の新店情報をフィルタリング（投稿履歴もチェック）
+            # 投稿履歴のスナップショットを今回の実行分として読み込み直し、まとめてチェック
+            await self.history_manager.refresh()
+            posted_flags = await self.history_manager.is_posted_many(candidates)
             tokyo_stores = [
-                item for item in recent_news
-                if self.crawler.is_tokyo_store(item) and not self.history_manager.is_posted(item)
+                item for item, is_posted in zip(candidates, posted_flags) if not is_posted
             ]
             
             if not tokyo_stores:
                 logger.info("都内の新店情報は見つかりませんでした")
+                await self._run_in_crawler(self.crawler.commit_progress)
                 return
             
             # Discordチャンネルに投稿
@@ -769,32 +2930,21 @@ class DiscordBot(discord.Client):
                 logger.error(f"チャンネルID {self.channel_id} が見つかりません")
                 return
             
-            for store_info in tokyo_stores:
-                embed = discord.Embed(
-                    title="東京に天下一品がオープンするよ！",
-                    description=store_info['title'],
-                    url=store_info['url'],
-                    color=discord.Color.orange(),
-                    timestamp=datetime.now()
-                )
-                embed.add_field(name="記事日付", value=store_info['date'], inline=True)
-                
-                # オープン日がある場合は表示
-                opening_date = store_info.get('opening_date')
-                if opening_date:
-                    embed.add_field(name="オープン日", value=opening_date, inline=True)
-                
-                embed.add_field(name="詳細", value=f"[記事を読む]({store_info['url']})", inline=True)
-                
-                await channel.send(embed=embed)
-                self.history_manager.mark_as_posted(store_info)
-                logger.info(f"投稿しました: {store_info['title']}")
-                
-                # レート制限を避けるため少し待機
-                await asyncio.sleep(1)
+            # レート制限はdiscord.pyがルートごとのバケットに従って待機する
+            await send_store_posts(lambda embeds: channel.send(embeds=embeds), self.history_manager, tokyo_stores)
+            
+            await self._run_in_crawler(self.crawler.commit_progress)
         
         except Exception as e:
             logger.error(f"クロール・投稿処理中にエラー: {e}", exc_info=True)
+        finally:
+            await self.history_manager.flush()
+            await self._run_in_crawler(self.crawler.finish_run)
+            if self.loop_lag_monitor.stall_count:
+                logger.info(
+                    f"イベントループの停止: {self.loop_lag_monitor.stall_count}回"
+                    f"（最大{self.loop_lag_monitor.max_lag:.2f}秒）"
+                )
 
 
 def main():
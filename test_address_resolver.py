@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+TokyoAddressResolver（詳細ページの住所から都内かどうかと区市町村を判定）のテスト
+"""
+
+import unittest
+
+from tenkaippin_bot import TOKYO_ADDRESS_RESOLVER
+
+
+class TokyoAddressResolverTest(unittest.TestCase):
+    """TOKYO_ADDRESS_RESOLVER.resolve のテスト"""
+
+    def resolve(self, text):
+        return TOKYO_ADDRESS_RESOLVER.resolve(text)
+
+    def test_postal_outside_tokyo_in_range(self):
+        # 199は神奈川県相模原市緑区の郵便番号
+        self.assertIsNone(self.resolve("〒199-0101 神奈川県相模原市緑区名倉"))
+        self.assertIsNone(self.resolve("〒199-0101 相模原市緑区名倉"))
+
+    def test_postal_followed_by_other_prefecture(self):
+        self.assertIsNone(self.resolve("〒160-0022 埼玉県さいたま市"))
+
+    def test_postal_with_ward(self):
+        result = self.resolve("〒160-0022 新宿区新宿3-1-1")
+        self.assertEqual(result['municipality'], "新宿区")
+        self.assertEqual(result['evidence'], 'postal')
+
+    def test_explicit_ward_overrides_postal_prefix(self):
+        # 台場の郵便番号は江東区と同じ135で始まるが、住所は港区
+        result = self.resolve("〒135-0091 東京都港区台場1-7-1")
+        self.assertEqual(result['municipality'], "港区")
+        self.assertEqual(result['evidence'], 'postal')
+
+    def test_postal_prefix_used_without_name(self):
+        result = self.resolve("〒135-0091 台場1-7-1")
+        self.assertEqual(result['municipality'], "江東区")
+
+    def test_shared_postal_area(self):
+        result = self.resolve("〒190-1211 石畑")
+        self.assertIsNotNone(result)
+        self.assertIsNone(result['municipality'])
+
+    def test_ambiguous_ward_requires_prefecture(self):
+        self.assertIsNone(self.resolve("大阪市北区梅田1-1"))
+        self.assertIsNone(self.resolve("名古屋市中央区"))
+        result = self.resolve("東京都北区赤羽1-1")
+        self.assertEqual(result['municipality'], "北区")
+        self.assertEqual(result['evidence'], 'prefecture')
+
+    def test_unambiguous_ward_without_prefecture(self):
+        result = self.resolve("住所：渋谷区道玄坂2-1")
+        self.assertEqual(result['municipality'], "渋谷区")
+        self.assertEqual(result['evidence'], 'municipality')
+
+    def test_prefecture_only_fills_municipality_later(self):
+        result = self.resolve("東京都内に出店します。所在地は練馬区です")
+        self.assertEqual(result['municipality'], "練馬区")
+
+    def test_island_addresses(self):
+        self.assertEqual(self.resolve("〒100-0101 元町1-1")['municipality'], "大島町")
+        self.assertEqual(self.resolve("〒100-1401 大賀郷")['municipality'], "八丈町")
+        self.assertEqual(self.resolve("東京都大島町元町")['municipality'], "大島町")
+        self.assertEqual(self.resolve("青ケ島村無番地")['municipality'], "青ヶ島村")
+
+    def test_other_oshima_town(self):
+        # 山口県の周防大島町は都内の大島町と判定しない
+        self.assertIsNone(self.resolve("山口県大島郡周防大島町小松"))
+
+    def test_no_address(self):
+        self.assertIsNone(self.resolve(""))
+        self.assertIsNone(self.resolve("新メニューのお知らせ"))
+
+
+if __name__ == '__main__':
+    unittest.main()